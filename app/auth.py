@@ -1,41 +1,78 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
 from typing import Optional
-from jose import JWTError, jwt
+from collections import OrderedDict
+from jose import JWTError, jwk, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from .config import settings
-from .database import get_supabase, verify_password, get_password_hash, get_user_by_email_cached, clear_user_cache
+from .database import get_user_by_email_cached, clear_user_cache
 from .models import TokenData
+import hashlib
+import time
 
 security = HTTPBearer()
 
+# Fixed error response arguments; see the note in app/routes/chat.py
+CREDENTIALS_INVALID = dict(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+USER_NOT_FOUND = dict(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found", headers={"WWW-Authenticate": "Bearer"})
+
+# Key material is parsed once here instead of by python-jose on every encode/decode
+JWT_KEY = jwk.construct(settings.jwt_secret_key, settings.jwt_algorithm)
+ACCESS_TOKEN_TTL_SECONDS = int(settings.jwt_expire_minutes) * 60
+
+# Validated token claims keyed by a hash of the token, so a burst of requests
+# with the same bearer token pays for signature verification once
+_token_cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+_token_cache_ttl = 30  # seconds
+_token_cache_max_size = 10_000
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire_seconds = expires_delta.total_seconds()
     else:
-        expire = datetime.utcnow() + timedelta(minutes=settings.jwt_expire_minutes)
+        expire_seconds = ACCESS_TOKEN_TTL_SECONDS
     
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.jwt_secret_key, algorithm=settings.jwt_algorithm)
+    # exp as integer epoch seconds, the form the JWT spec uses
+    to_encode = {**data, "exp": int(time.time() + expire_seconds)}
+    encoded_jwt = jwt.encode(to_encode, JWT_KEY, algorithm=settings.jwt_algorithm)
     return encoded_jwt
 
 def verify_token(token: str) -> TokenData:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+    token_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    cached = _token_cache.get(token_key)
+    if cached is not None:
+        token_data, expires_at = cached
+        # expires_at never exceeds the token's own exp claim
+        if time.time() < expires_at:
+            return token_data
+        _token_cache.pop(token_key, None)
     
     try:
-        payload = jwt.decode(token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm])
+        payload = jwt.decode(token, JWT_KEY, algorithms=[settings.jwt_algorithm])
         email: str = payload.get("sub")
         if email is None:
-            raise credentials_exception
-        token_data = TokenData(email=email)
-        return token_data
+            raise HTTPException(**CREDENTIALS_INVALID)
+        # Tokens issued before the uid claim was added carry only the email
+        token_data = TokenData(email=email, user_id=payload.get("uid"))
     except JWTError:
-        raise credentials_exception
+        raise HTTPException(**CREDENTIALS_INVALID)
+    
+    now = time.time()
+    expires_at = now + _token_cache_ttl
+    if payload.get("exp") is not None:
+        expires_at = min(expires_at, payload["exp"])
+    _token_cache[token_key] = (token_data, expires_at)
+    if len(_token_cache) > _token_cache_max_size:
+        _token_cache.popitem(last=False)
+    return token_data
+
+def clear_token_cache(email: str = None):
+    """Drop cached token claims for one user, or all of them"""
+    if email is None:
+        _token_cache.clear()
+        return
+    for token_key in [k for k, (data, _) in _token_cache.items() if data.email == email]:
+        del _token_cache[token_key]
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """
@@ -48,35 +85,29 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     user = await get_user_by_email_cached(token_data.email)
     
     if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise HTTPException(**USER_NOT_FOUND)
     
     return user
 
-def authenticate_user(email: str, password: str):
+async def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
     """
-    Legacy authenticate_user function - kept for backward compatibility
-    Consider using authenticate_user_optimized for new implementations
+    Resolve the authenticated user's id once per request for handlers that
+    only need the id. The id is read from the token's uid claim with no
+    database work; older tokens without it fall back to the cached lookup.
     """
-    supabase = get_supabase()
-    try:
-        response = supabase.table("users").select("*").eq("email", email).execute()
-        if not response.data:
-            return False
-        
-        user = response.data[0]
-        if not verify_password(password, user["password"]):
-            return False
-        
-        return user
-    except Exception:
-        return False
+    token_data = verify_token(credentials.credentials)
+    if token_data.user_id:
+        return token_data.user_id
+    
+    user = await get_user_by_email_cached(token_data.email)
+    if not user:
+        raise HTTPException(**USER_NOT_FOUND)
+    
+    return user["id"]
 
 async def logout_user(email: str):
     """
     Clear user cache on logout for security
     """
     clear_user_cache(email)
+    clear_token_cache(email)
@@ -1,17 +1,37 @@
 import json
+import time
+import asyncio
+import logging
+import orjson
 import requests
-from openai import OpenAI
-from datetime import datetime
-from .database import get_supabase
+import anyio
+from requests.adapters import HTTPAdapter
+from openai import AsyncOpenAI, OpenAIError
+from fastapi.concurrency import run_in_threadpool
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+from collections import OrderedDict
+from .database import get_supabase, execute_query
 from .config import settings
+from .models import DateRangeToolArgs, TopClickedUrlsArgs, EventLogSliceArgs, CampaignReasoningArgs
+from . import semantic_cache
+
+logger = logging.getLogger(__name__)
 
 # Initialize OpenAI client
-client = OpenAI(api_key=settings.openai_api_key)
+client = AsyncOpenAI(api_key=settings.openai_api_key)
 
 # Supabase configuration from environment
 SUPABASE_BASE_URL = settings.supabase_edge_function_url
 SUPABASE_API_KEY = settings.supabase_anon_key
 
+# Shared HTTP session for Edge Function calls so connections (and their TLS
+# handshakes) are reused across requests. Calls run in the threadpool, so the
+# pool is sized for many concurrent worker threads.
+edge_session = requests.Session()
+edge_session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=50))
+edge_session.mount("http://", HTTPAdapter(pool_connections=10, pool_maxsize=50))
+
 # Mapping of tool names to Supabase Edge function endpoints
 SUPABASE_FUNCTIONS = {
     "getOrdersOverTime": "get-orders-over-time",
@@ -72,6 +92,108 @@ HTTP_METHODS = {
     "getEventLogSlice": "POST"
 }
 
+# Klaviyo tools whose date range arguments are plain dates (inclusive) or date-times (end exclusive)
+KLAVIYO_DATE_TOOLS = {"getEventCounts", "getEmailEventRatios", "getTopClickedUrls", "getEventLogSlice"}
+KLAVIYO_DATETIME_TOOLS = {"getCampaignReasoning"}
+_RELATIVE_DAY_OFFSETS = {"today": 0, "now": 0, "current day": 0, "yesterday": -1}
+
+# Models that check the model-produced arguments of these tools before the edge
+# call, so malformed ranges go back to the model instead of reaching Supabase
+TOOL_ARG_MODELS = {
+    "getEventCounts": DateRangeToolArgs,
+    "getEmailEventRatios": DateRangeToolArgs,
+    "getTopClickedUrls": TopClickedUrlsArgs,
+    "getEventLogSlice": EventLogSliceArgs,
+    "getCampaignReasoning": CampaignReasoningArgs,
+}
+
+# Aggregation tools are pure functions of their arguments. Results for ranges
+# that ended before today never change; ranges that include today go stale quickly
+CACHEABLE_TOOLS = {"getEventCounts", "getEmailEventRatios", "getTopClickedUrls"}
+_tool_result_cache: "OrderedDict[Tuple[str, bytes], Dict]" = OrderedDict()
+_tool_result_cache_max_size = 1_000
+_tool_result_ttl_past = 86_400  # 1 day for ranges entirely in the past
+_tool_result_ttl_current = 300  # 5 minutes for ranges that include today
+
+def tool_result_ttl(args: dict) -> int:
+    """How long a cacheable tool result for these (normalized) arguments stays valid"""
+    try:
+        end_date = date.fromisoformat(str(args.get("end_date"))[:10])
+    except ValueError:
+        return _tool_result_ttl_current
+    return _tool_result_ttl_past if end_date < date.today() else _tool_result_ttl_current
+
+async def call_tool(fn_name: str, fn_args: dict) -> dict:
+    """Run a tool call against its edge function, serving cacheable aggregation results from memory"""
+    if fn_name not in CACHEABLE_TOOLS:
+        return await run_in_threadpool(call_supabase_edge, fn_name, fn_args)
+    
+    cache_key = (fn_name, orjson.dumps(fn_args, option=orjson.OPT_SORT_KEYS))
+    cache_entry = _tool_result_cache.get(cache_key)
+    if cache_entry and time.time() - cache_entry['timestamp'] < cache_entry['ttl']:
+        _tool_result_cache.move_to_end(cache_key)
+        logger.debug("Tool result for %s served from cache", fn_name)
+        return cache_entry['data']
+    
+    result = await run_in_threadpool(call_supabase_edge, fn_name, fn_args)
+    
+    # Errors (timeouts, non-200 responses) are retried on the next call, never cached
+    if not (isinstance(result, dict) and "error" in result):
+        _tool_result_cache[cache_key] = {
+            'data': result,
+            'timestamp': time.time(),
+            'ttl': tool_result_ttl(fn_args)
+        }
+        _tool_result_cache.move_to_end(cache_key)
+        while len(_tool_result_cache) > _tool_result_cache_max_size:
+            _tool_result_cache.popitem(last=False)
+    
+    return result
+
+def normalize_date_args(fn_name: str, args: dict) -> dict:
+    """
+    Give Klaviyo tools concrete date range bounds the event tables can compare
+    against their timestamp index: relative words are resolved against today,
+    date tools get YYYY-MM-DD values, and a bare end date for a date-time tool
+    becomes the following midnight (a half-open range)
+    """
+    if fn_name not in KLAVIYO_DATE_TOOLS and fn_name not in KLAVIYO_DATETIME_TOOLS:
+        return args
+    
+    # Bounds given with a time of day, and midnights generated for bare dates
+    explicit, generated = {}, {}
+    for field in ("start_date", "end_date"):
+        value = args.get(field)
+        if not isinstance(value, str):
+            continue
+        
+        offset = _RELATIVE_DAY_OFFSETS.get(value.strip().lower())
+        if offset is not None:
+            day, has_time = date.today() + timedelta(days=offset), False
+        else:
+            try:
+                parsed = datetime.fromisoformat(value.strip())
+            except ValueError:
+                continue  # Leave anything unrecognized for the edge function to reject
+            day, has_time = parsed.date(), "T" in value or " " in value.strip()
+            if has_time:
+                explicit[field] = parsed
+        
+        if fn_name in KLAVIYO_DATE_TOOLS:
+            args[field] = day.isoformat()
+        elif not has_time:
+            if field == "end_date":
+                day += timedelta(days=1)
+            generated[field] = datetime.combine(day, datetime.min.time())
+    
+    # A generated midnight takes the timezone of an explicit bound, so the two
+    # bounds stay comparable
+    tzinfo = next((bound.tzinfo for bound in explicit.values() if bound.tzinfo), None)
+    for field, midnight in generated.items():
+        args[field] = midnight.replace(tzinfo=tzinfo).isoformat()
+    
+    return args
+
 
 async def create_session_optimized(user_id: str, title: str = None) -> dict:
     """
@@ -97,7 +219,7 @@ async def create_session_optimized(user_id: str, title: str = None) -> dict:
             "title": title or "New Chat"
         }
         
-        resp = supabase.table("chat_sessions").insert(session_data).execute()
+        resp = await execute_query(supabase.table("chat_sessions").insert(session_data))
         
         if resp.data and len(resp.data) > 0:
             return resp.data[0]
@@ -105,20 +227,20 @@ async def create_session_optimized(user_id: str, title: str = None) -> dict:
             raise Exception("Failed to create session - no data returned")
             
     except Exception as e:
-        print(f"Failed to create session: {str(e)}")
+        logger.error("Failed to create session: %s", e)
         raise
 
-def get_session_info(session_id: str) -> dict:
-    """Get basic session information by ID"""
+async def get_session_info(session_id: str, user_id: str) -> dict:
+    """Get basic session information by ID; sessions owned by other users are not found"""
     try:
         supabase = get_supabase()
-        session = (
+        response = await execute_query(
             supabase.table("chat_sessions")
             .select("id, title, created_at, user_id")
             .eq("id", session_id)
-            .execute()
-            .data
+            .eq("user_id", user_id)
         )
+        session = response.data
         
         if session and len(session) > 0:
             return session[0]
@@ -126,16 +248,16 @@ def get_session_info(session_id: str) -> dict:
             raise ValueError("Session not found")
             
     except Exception as e:  
-        print(f"Error getting session info: {e}")
+        logger.error("Error getting session info: %s", e)
         raise
 
-def update_chat_title(session_id: str, user_message: str):
+async def update_chat_title(session_id: str, user_message: str):
     """Generate and update chat title based on first user message"""
     try:
         # Generate a title using OpenAI
         title_prompt = f"Generate a short, descriptive title (max 50 characters) for a chat conversation that starts with: '{user_message[:200]}...'"
         
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-4o",
             messages=[
                 {
@@ -164,39 +286,120 @@ def update_chat_title(session_id: str, user_message: str):
         
         # Update the session title in the database
         supabase = get_supabase()
-        supabase.table("chat_sessions").update({
+        await execute_query(supabase.table("chat_sessions").update({
             "title": generated_title
-        }).eq("id", session_id).execute()
+        }).eq("id", session_id))
         
         return generated_title
         
     except Exception as e:
-        print(f"Error generating chat title: {e}")
+        logger.error("Error generating chat title: %s", e)
         # If title generation fails, use a fallback
         fallback_title = user_message[:30] + "..." if len(user_message) > 30 else user_message
         try:
             supabase = get_supabase()
-            supabase.table("chat_sessions").update({
+            await execute_query(supabase.table("chat_sessions").update({
                 "title": fallback_title
-            }).eq("id", session_id).execute()
+            }).eq("id", session_id))
         except:
             pass
         return fallback_title
 
 
-async def call_openai_streaming(user_message: str, tools, session_id: str, user_id: str):
+async def embed_text(text: str) -> list:
+    """Embed text with the configured OpenAI embedding model"""
+    response = await client.embeddings.create(
+        model=settings.embedding_model,
+        input=text,
+        dimensions=settings.embedding_dimensions
+    )
+    return response.data[0].embedding
+
+async def warm_up_openai():
+    """
+    Issue one tiny embedding request at startup so the first chat finds an open,
+    already-handshaken connection in the shared OpenAI client pool
+    """
+    try:
+        # Copies of the client share its HTTP pool; fail fast rather than delay startup
+        await client.with_options(timeout=5.0, max_retries=0).embeddings.create(
+            model=settings.embedding_model,
+            input="warm up",
+            dimensions=settings.embedding_dimensions
+        )
+    except OpenAIError as e:
+        logger.warning("OpenAI warm-up request failed: %s", e)
+
+async def lookup_cached_response(user_id: str, user_message: str):
+    """
+    Look up a cached answer for an opening message: exact match first, then
+    embedding similarity. Returns (answer or None, embedding to store on a miss).
+    """
+    cached = semantic_cache.get_exact(user_id, user_message)
+    if cached is not None:
+        return cached, None
+    
+    # Definite miss: skip the embedding round trip; it is computed after the
+    # answer has streamed instead (see store_cached_response)
+    if not semantic_cache.has_vectors(user_id):
+        return None, None
+    
+    try:
+        embedding = await embed_text(semantic_cache.canonicalize(user_message))
+    except OpenAIError as e:
+        logger.error("Error embedding message for semantic cache: %s", e)
+        return None, None
+    
+    return semantic_cache.get_similar(user_id, user_message, embedding), embedding
+
+# Background embed-and-store tasks, referenced until done so they are not garbage collected
+_cache_store_tasks = set()
+# Background user-message inserts, referenced the same way
+_message_save_tasks = set()
+
+async def store_cached_response(user_id: str, user_message: str, response: str):
+    """Embed a prompt whose lookup skipped embedding, then cache its answer"""
+    embedding = None
+    try:
+        embedding = await embed_text(semantic_cache.canonicalize(user_message))
+    except OpenAIError as e:
+        logger.error("Error embedding message for semantic cache: %s", e)
+    semantic_cache.store(user_id, user_message, embedding, response)
+
+async def call_openai_streaming(user_message: str, tools_payload: list, session_id: str, user_id: str):
     """
-    Streaming OpenAI API call function for real-time responses
+    Streaming OpenAI API call function for real-time responses; tools_payload is
+    the pre-encoded tool schema (openai_tools.TOOLS_PAYLOAD)
     """
+    # Assistant and tool messages produced during this turn are written together in one insert
+    pending_messages = []
     try:
         # Get chat history asynchronously
-        history = get_history(session_id)
+        history = await get_history(session_id)
         messages = [{"role": msg["role"], "content": msg["content"]} for msg in history]
 
         # Check if this is the first message and generate title if needed
         if len(history) == 0:
             # This is the first message, generate a title asynchronously
-            update_chat_title(session_id, user_message)
+            await update_chat_title(session_id, user_message)
+        
+        # Opening messages carry no conversation context, so their answers can be
+        # reused for the same or a near-identical prompt from this user today
+        # (a message that is nothing but filler has no canonical form to match on)
+        use_semantic_cache = (
+            settings.semantic_cache_enabled and len(history) == 0
+            and bool(semantic_cache.canonicalize(user_message))
+        )
+        embedding = None
+        if use_semantic_cache:
+            cached_response, embedding = await lookup_cached_response(user_id, user_message)
+            if cached_response is not None:
+                logger.info("Semantic cache hit for session %s", session_id)
+                pending_messages.append(build_message(session_id, "user", user_message))
+                pending_messages.append(build_message(session_id, "assistant", cached_response))
+                for content in semantic_cache.replay_chunks(cached_response):
+                    yield {"type": "content", "content": content}
+                return
 
         # Get current date for context
         current_date = datetime.now()
@@ -316,40 +519,65 @@ async def call_openai_streaming(user_message: str, tools, session_id: str, user_
             {"role": "user", "content": user_message}
         ]
         
-        # Save user message
-        save_message(session_id, "user", user_message)
+        # Save the user message before the model call, without waiting for the
+        # insert: it must survive a crash or a hung completion, which would lose
+        # anything still queued for the end of the turn. Its created_at is taken
+        # now, so it still sorts before the reply.
+        task = asyncio.create_task(save_messages([build_message(session_id, "user", user_message)]))
+        _message_save_tasks.add(task)
+        task.add_done_callback(_message_save_tasks.discard)
 
         # Call OpenAI with streaming
-        stream = client.chat.completions.create(
+        stream = await client.chat.completions.create(
             model="gpt-4o",
             messages=openai_messages,
-            tools=tools,
             tool_choice="auto",
+            # Sent as is, skipping the SDK's per-request transform of the large schema
+            extra_body={"tools": tools_payload},
             temperature=0.1,
             max_tokens=4000,
             stream=True
         )
 
         # Handle streaming response
-        async for chunk in handle_openai_streaming_response(stream, session_id, openai_messages):
+        outcome = {}
+        async for chunk in handle_openai_streaming_response(stream, session_id, openai_messages, pending_messages, outcome):
             yield chunk
+        
+        if use_semantic_cache and outcome.get("content"):
+            if embedding is None:
+                # Embed off the response path so the stream completes immediately
+                task = asyncio.create_task(store_cached_response(user_id, user_message, outcome["content"]))
+                _cache_store_tasks.add(task)
+                task.add_done_callback(_cache_store_tasks.discard)
+            else:
+                semantic_cache.store(user_id, user_message, embedding, outcome["content"])
 
     except Exception as e:
         error_msg = f"Error in call_openai_streaming: {str(e)}"
-        print(error_msg)
-        save_message(session_id, "assistant", error_msg)
+        logger.error(error_msg)
+        pending_messages.append(build_message(session_id, "assistant", error_msg))
         yield {"type": "error", "content": error_msg}
+    finally:
+        # Single round trip for the whole turn; also runs if the client disconnects mid-stream,
+        # so shield it from the cancellation that a disconnect delivers
+        with anyio.CancelScope(shield=True):
+            await save_messages(pending_messages)
 
-async def handle_openai_streaming_response(stream, session_id: str, messages: list):
+async def handle_openai_streaming_response(stream, session_id: str, messages: list, pending_messages: list, outcome: Optional[dict] = None):
     """
-    Handle streaming response from OpenAI API
+    Handle streaming response from OpenAI API; produced messages are queued
+    on pending_messages for the caller to save, and a successful final answer
+    is reported back through outcome["content"]
     """
+    if outcome is None:
+        outcome = {}
     try:
         accumulated_content = ""
         tool_calls = []
         current_tool_call = None
         
-        for chunk in stream:
+        async for chunk in stream:
             if not chunk.choices:
                 continue
                 
@@ -402,33 +630,37 @@ async def handle_openai_streaming_response(stream, session_id: str, messages: li
             for tool_call in tool_calls:
                 try:
                     fn_name = tool_call["function"]["name"]
-                    fn_args = json.loads(tool_call["function"]["arguments"] or "{}")
+                    fn_args = normalize_date_args(fn_name, orjson.loads(tool_call["function"]["arguments"] or "{}"))
+                    arg_model = TOOL_ARG_MODELS.get(fn_name)
+                    if arg_model is not None:
+                        # A ValidationError is reported to the model as a failed tool call
+                        fn_args = arg_model(**fn_args).model_dump(mode="json", exclude_none=True)
                     
                     yield {"type": "tool_execution", "content": f"Executing {fn_name}..."}
                     
                     # Call Supabase Edge Function directly with GPT's parameters
-                    result = call_supabase_edge(fn_name, fn_args)
+                    result = await call_tool(fn_name, fn_args)
                     
                     # Add tool result to messages
                     messages.append({
                         "role": "tool",
                         "tool_call_id": tool_call["id"],
-                        "content": json.dumps(result, default=str)
+                        "content": orjson.dumps(result, default=str).decode()
                     })
                     
                 except Exception as tool_error:
-                    print(f"Error executing tool {fn_name}: {tool_error}")
+                    logger.error("Error executing tool %s: %s", fn_name, tool_error)
                     error_result = {"error": f"Tool execution failed: {str(tool_error)}"}
                     messages.append({
                         "role": "tool",
                         "tool_call_id": tool_call["id"],
-                        "content": json.dumps(error_result)
+                        "content": orjson.dumps(error_result).decode()
                     })
             
             # Get final response from OpenAI with tool results
             yield {"type": "final_response", "content": "Generating final response..."}
             
-            final_stream = client.chat.completions.create(
+            final_stream = await client.chat.completions.create(
                 model="gpt-4o",
                 messages=messages,
                 temperature=0.1,
@@ -437,7 +669,7 @@ async def handle_openai_streaming_response(stream, session_id: str, messages: li
             )
             
             final_content = ""
-            for chunk in final_stream:
+            async for chunk in final_stream:
                 if chunk.choices and chunk.choices[0].delta.content:
                     content = chunk.choices[0].delta.content
                     final_content += content
@@ -449,26 +681,22 @@ async def handle_openai_streaming_response(stream, session_id: str, messages: li
             # Save the final response
             if final_content:
                 final_content = enhance_response_formatting(final_content)
-                print(f"\n=== FINAL CHAT RESPONSE ===")
-                print(final_content)
-                print("=" * 50)
-                save_message(session_id, "assistant", final_content)
+                logger.debug("Final chat response for session %s:\n%s", session_id, final_content)
+                pending_messages.append(build_message(session_id, "assistant", final_content))
+                outcome["content"] = final_content
         
         else:
             # No tool calls, just save the accumulated content
             if accumulated_content:
                 accumulated_content = enhance_response_formatting(accumulated_content)
-                print(f"\n=== FINAL CHAT RESPONSE (NO TOOL CALLS) ===")
-                print(accumulated_content)
-                print("=" * 50)
-                save_message(session_id, "assistant", accumulated_content)
+                logger.debug("Final chat response (no tool calls) for session %s:\n%s", session_id, accumulated_content)
+                pending_messages.append(build_message(session_id, "assistant", accumulated_content))
+                outcome["content"] = accumulated_content
     
     except Exception as e:
         error_msg = f"Error handling streaming response: {str(e)}"
-        print(f"\n=== CHAT ERROR ===")
-        print(error_msg)
-        print("=" * 50)
-        save_message(session_id, "assistant", error_msg)
+        logger.error(error_msg)
+        pending_messages.append(build_message(session_id, "assistant", error_msg))
         yield {"type": "error", "content": error_msg}
 
 
@@ -480,15 +708,7 @@ def call_supabase_edge(fn_name: str, args: dict) -> dict:
         url = f"{SUPABASE_BASE_URL}/{mapped_name}"
         
         # Print detailed API call information
-        print("=" * 80)
-        print("🔍 SUPABASE API CALL DEBUG INFO")
-        print("=" * 80)
-        print(f"📞 Function Name: {fn_name}")
-        print(f"🔗 Mapped Endpoint: {mapped_name}")
-        print(f"🌐 Full URL: {url}")
-        print(f"📋 Parameters: {json.dumps(args, indent=2, default=str)}")
-        print(f"⏰ Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print("-" * 80)
+        logger.debug("Supabase function %s -> %s (%s) with parameters %s", fn_name, mapped_name, url, args)
         
         headers = {
             "Authorization": f"Bearer {SUPABASE_API_KEY}",
@@ -506,80 +726,74 @@ def call_supabase_edge(fn_name: str, args: dict) -> dict:
                 import urllib.parse
                 query_params = urllib.parse.urlencode(args)
                 url = f"{url}?{query_params}"
-            print(f"📤 Making GET request to: {url}")
-            response = requests.get(url, headers=headers, timeout=30)
+            response = edge_session.get(url, headers=headers, timeout=30)
         else:
             # For POST requests, send data in body
-            print(f"📤 Making POST request to: {url}")
-            print(f"📦 Request payload: {json.dumps(args, indent=2, default=str)}")
-            response = requests.post(url, headers=headers, json=args, timeout=30)
+            response = edge_session.post(url, headers=headers, json=args, timeout=30)
         
-        print(f"📥 Response Status: {response.status_code}")
-        print(f"📄 Response Headers: {dict(response.headers)}")
+        logger.debug("Supabase function %s responded with status %s", fn_name, response.status_code)
         
         if response.status_code == 200:
             try:
-                result = response.json()
-                print(f"✅ Success Response: {json.dumps(result, indent=2, default=str)}")
-                print("=" * 80)
+                result = orjson.loads(response.content)
                 return result
             except json.JSONDecodeError as e:
-                print(f"⚠️  JSON Decode Error: {e}")
-                print(f"📄 Raw Response: {response.text}")
-                print("=" * 80)
+                logger.warning("Supabase function %s returned invalid JSON: %s", fn_name, e)
                 return {"data": response.text, "warning": "Response was not valid JSON"}
         else:
             error_msg = f"Supabase function returned status {response.status_code}: {response.text}"
-            print(f"❌ Error Response: {error_msg}")
-            print("=" * 80)
+            logger.error(error_msg)
             return {"error": error_msg, "status_code": response.status_code}
             
     except requests.exceptions.Timeout:
         error_msg = "Request to Supabase function timed out"
-        print(f"⏰ Timeout Error: {error_msg}")
-        print("=" * 80)
+        logger.error(error_msg)
         return {"error": error_msg}
     except requests.exceptions.RequestException as req_err:
         error_msg = f"Request to Supabase function failed: {str(req_err)}"
-        print(f"🌐 Request Error: {error_msg}")
-        print("=" * 80)
+        logger.error(error_msg)
         return {"error": error_msg}
     except Exception as e:
         error_msg = f"Unexpected error calling Supabase function: {str(e)}"
-        print(f"💥 Unexpected Error: {error_msg}")
-        print("=" * 80)
+        logger.error(error_msg)
         return {"error": error_msg}
 
-def save_message(session_id: str, role: str, content: str):
-    """Save message to database"""
+def build_message(session_id: str, role: str, content: str) -> dict:
+    """Build a chat_messages row stamped with the time it was produced"""
+    if not content or content.strip() == "":
+        content = "Empty message"
+    
+    # Explicit timestamps keep ordering intact when rows are inserted in one batch
+    return {
+        "session_id": session_id,
+        "role": role,
+        "content": content,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+
+async def save_messages(messages: list):
+    """Save several messages to database with a single insert"""
+    if not messages:
+        return
     try:
-        if not content or content.strip() == "":
-            content = "Empty message"
-        
         supabase = get_supabase()
-        supabase.table("chat_messages").insert({
-            "session_id": session_id,
-            "role": role,
-            "content": content
-        }).execute()
+        await execute_query(supabase.table("chat_messages").insert(messages))
     except Exception as e:
-        print(f"Error saving message: {e}")
+        logger.error("Error saving messages: %s", e)
 
-def get_history(session_id: str) -> list:
+async def get_history(session_id: str) -> list:
     """Get chat history for a session"""
     try:
         supabase = get_supabase()
-        history = (
+        response = await execute_query(
             supabase.table("chat_messages")
-            .select("*")
+            .select("role, content")
             .eq("session_id", session_id)
             .order("created_at")
-            .execute()
-            .data
         )
-        return history or []
+        return response.data or []
     except Exception as e:
-        print(f"Error getting history: {e}")
+        logger.error("Error getting history: %s", e)
         return []
 
 async def get_user_chat_sessions_optimized(user_id: str, page: int = 1, pagination: int = 10) -> dict:
@@ -632,33 +846,35 @@ async def get_user_chat_sessions_optimized(user_id: str, page: int = 1, paginati
         LIMIT {pagination} OFFSET {offset}
         """
         
-        # Get total count in parallel
-        total_count_response = (
-            supabase.table("chat_sessions")
-            .select("id", count="exact")
-            .eq("user_id", user_id)
-            .execute()
+        async def fetch_page() -> list:
+            try:
+                # Try the optimized SQL query first
+                sessions_response = await execute_query(supabase.rpc('get_user_sessions_optimized', {
+                    'user_id_param': user_id,
+                    'limit_param': pagination,
+                    'offset_param': offset
+                }))
+                
+                if sessions_response.data:
+                    return sessions_response.data
+                # Fallback to the original approach if RPC doesn't exist
+                return await _get_sessions_fallback(supabase, user_id, pagination, offset)
+            except Exception:
+                # Fallback to original approach if optimized query fails
+                return await _get_sessions_fallback(supabase, user_id, pagination, offset)
+        
+        # The total count and the page itself are independent, so run them in parallel
+        total_count_response, sessions = await asyncio.gather(
+            execute_query(
+                supabase.table("chat_sessions")
+                .select("id", count="exact")
+                .eq("user_id", user_id)
+                .limit(1)
+            ),
+            fetch_page()
         )
         total_sessions = total_count_response.count or 0
         
-        # Execute the optimized query
-        try:
-            # Try the optimized SQL query first
-            sessions_response = supabase.rpc('get_user_sessions_optimized', {
-                'user_id_param': user_id,
-                'limit_param': pagination,
-                'offset_param': offset
-            }).execute()
-            
-            if sessions_response.data:
-                sessions = sessions_response.data
-            else:
-                # Fallback to the original approach if RPC doesn't exist
-                sessions = await _get_sessions_fallback(supabase, user_id, pagination, offset)
-        except Exception:
-            # Fallback to original approach if optimized query fails
-            sessions = await _get_sessions_fallback(supabase, user_id, pagination, offset)
-        
         # Calculate pagination metadata
         total_pages = (total_sessions + pagination - 1) // pagination if total_sessions > 0 else 0
         has_next = page < total_pages
@@ -675,7 +891,7 @@ async def get_user_chat_sessions_optimized(user_id: str, page: int = 1, paginati
         }
         
     except Exception as e:
-        print(f"Error getting user chat sessions: {e}")
+        logger.error("Error getting user chat sessions: %s", e)
         return {
             "sessions": [],
             "total_sessions": 0,
@@ -691,16 +907,14 @@ async def _get_sessions_fallback(supabase, user_id: str, pagination: int, offset
     Fallback method using optimized batch queries instead of N+1
     """
     # Get paginated chat sessions
-    sessions = (
+    sessions = (await execute_query(
         supabase.table("chat_sessions")
         .select("id, title, created_at")
         .eq("user_id", user_id)
         .order("created_at", desc=True)
         .limit(pagination)
         .offset(offset)
-        .execute()
-        .data
-    )
+    )).data
     
     if not sessions:
         return []
@@ -710,12 +924,11 @@ async def _get_sessions_fallback(supabase, user_id: str, pagination: int, offset
     # Batch query for message counts
     message_counts = {}
     if session_ids:
-        counts_response = (
+        counts_response = (await execute_query(
             supabase.table("chat_messages")
             .select("session_id", count="exact")
             .in_("session_id", session_ids)
-            .execute()
-        )
+        ))
         
         # Group counts by session_id
         for count_data in counts_response.data:
@@ -724,18 +937,20 @@ async def _get_sessions_fallback(supabase, user_id: str, pagination: int, offset
     # Batch query for last messages
     last_messages = {}
     if session_ids:
-        # Get the most recent message for each session
-        for session_id in session_ids:
-            last_msg = (
+        # Get the most recent message for each session; the lookups are independent
+        last_msg_responses = await asyncio.gather(*(
+            execute_query(
                 supabase.table("chat_messages")
                 .select("content, created_at")
                 .eq("session_id", session_id)
                 .order("created_at", desc=True)
                 .limit(1)
-                .execute()
-                .data
             )
-            
+            for session_id in session_ids
+        ))
+        
+        for session_id, last_msg_response in zip(session_ids, last_msg_responses):
+            last_msg = last_msg_response.data
             if last_msg:
                 last_messages[session_id] = {
                     "content": last_msg[0]["content"],
@@ -758,149 +973,59 @@ async def _get_sessions_fallback(supabase, user_id: str, pagination: int, offset
     return sessions
 
 
-def get_chat_detail(session_id: str, user_id: str) -> dict:
-    """Get detailed chat information including all messages for a specific session"""
+async def get_chat_detail_optimized(session_id: str, user_id: str, message_limit: Optional[int] = None) -> dict:
+    """
+    Optimized function to get detailed chat information with single query approach:
+    ownership check, session info and messages come back in one embedded select.
+    With message_limit only the first page of messages is embedded.
+    """
     try:
         supabase = get_supabase()
         
-        # First verify the session belongs to the user
-        session_check = (
+        # Messages are embedded through the chat_messages -> chat_sessions foreign key
+        query = (
             supabase.table("chat_sessions")
-            .select("id, title, created_at, user_id")
+            .select("id, title, created_at, user_id, chat_messages(id, role, content, created_at, session_id)")
             .eq("id", session_id)
-            .execute()
-            .data
-        )
-        
-        if not session_check:
-            raise ValueError("Chat session not found")
-        
-        if session_check[0]["user_id"] != user_id:
-            raise ValueError("You can only view your own chat sessions")
-        
-        session_info = session_check[0]
-        
-        # Get all messages for this session
-        messages = (
-            supabase.table("chat_messages")
-            .select("id, role, content, created_at, session_id")
-            .eq("session_id", session_id)
-            .order("created_at")
-            .execute()
-            .data
+            .eq("user_id", user_id)
+            .order("created_at", foreign_table="chat_messages")
         )
+        if message_limit:
+            query = query.limit(message_limit, foreign_table="chat_messages")
         
-        return {
-            "session_id": session_id,
-            "title": session_info["title"],
-            "created_at": session_info["created_at"],
-            "user_id": user_id,
-            "messages": messages or [],
-            "total_messages": len(messages) if messages else 0
-        }
-        
-    except Exception as e:
-        print(f"Error getting chat detail: {e}")
-        raise
-
-async def get_chat_detail_optimized(session_id: str, user_id: str) -> dict:
-    """
-    Optimized function to get detailed chat information with single query approach
-    """
-    try:
-        supabase = get_supabase()
-        
-        # Single optimized query to get session info and verify ownership
-        session_query = f"""
-        SELECT 
-            cs.id,
-            cs.title,
-            cs.created_at,
-            cs.user_id,
-            COUNT(cm.id) as total_messages
-        FROM chat_sessions cs
-        LEFT JOIN chat_messages cm ON cs.id = cm.session_id
-        WHERE cs.id = '{session_id}' AND cs.user_id = '{user_id}'
-        GROUP BY cs.id, cs.title, cs.created_at, cs.user_id
-        """
+        session_response = (await execute_query(query)).data
         
-        try:
-            # Try optimized SQL query first
-            session_response = supabase.rpc('get_chat_detail_optimized', {
-                'session_id_param': session_id,
-                'user_id_param': user_id
-            }).execute()
-            
-            if session_response.data:
-                session_data = session_response.data[0]
-            else:
-                # Fallback to original approach if RPC doesn't exist
-                session_data = await _get_chat_detail_fallback(supabase, session_id, user_id)
-        except Exception:
-            # Fallback to original approach if optimized query fails
-            session_data = await _get_chat_detail_fallback(supabase, session_id, user_id)
-        
-        if not session_data:
+        if not session_response:
             raise ValueError("Chat session not found or you don't have permission to view it")
         
-        # Get all messages for this session
-        messages = (
-            supabase.table("chat_messages")
-            .select("id, role, content, created_at, session_id")
-            .eq("session_id", session_id)
-            .order("created_at")
-            .execute()
-            .data
-        )
+        session_data = session_response[0]
+        messages = session_data.get("chat_messages") or []
         
         return {
             "session_id": session_id,
             "title": session_data["title"],
             "created_at": session_data["created_at"],
             "user_id": user_id,
-            "messages": messages or [],
-            "total_messages": len(messages) if messages else 0
+            "messages": messages,
+            "total_messages": len(messages)
         }
         
     except Exception as e:
-        print(f"Error getting optimized chat detail: {e}")
+        logger.error("Error getting optimized chat detail: %s", e)
         raise
 
-async def _get_chat_detail_fallback(supabase, session_id: str, user_id: str) -> dict:
-    """
-    Fallback method using original approach with ownership verification
-    """
-    # Verify the session belongs to the user
-    session_check = (
-        supabase.table("chat_sessions")
-        .select("id, title, created_at, user_id")
-        .eq("id", session_id)
-        .eq("user_id", user_id)  # Add user_id filter to make query more efficient
-        .execute()
-        .data
-    )
-    
-    if not session_check:
-        return None
-    
-    session_info = session_check[0]
-    
-    # Get total message count
-    total_count_response = (
+async def get_chat_messages_page(session_id: str, offset: int, limit: int) -> list:
+    """Get one page of a session's messages in chronological order"""
+    supabase = get_supabase()
+    messages = (await execute_query(
         supabase.table("chat_messages")
-        .select("id", count="exact")
+        .select("id, role, content, created_at, session_id")
         .eq("session_id", session_id)
-        .execute()
-    )
-    total_messages = total_count_response.count or 0
-    
-    return {
-        "id": session_info["id"],
-        "title": session_info["title"],
-        "created_at": session_info["created_at"],
-        "user_id": session_info["user_id"],
-        "total_messages": total_messages
-    }
+        .order("created_at")
+        .limit(limit)
+        .offset(offset)
+    )).data
+    return messages or []
 
 
 async def delete_chat_session_optimized(session_id: str, user_id: str) -> bool:
@@ -919,24 +1044,25 @@ async def delete_chat_session_optimized(session_id: str, user_id: str) -> bool:
         
         supabase = get_supabase()
         
-        # Single query to verify ownership and get session info
-        session_check = (
+        # Lightweight existence probe: ownership is decided by the filters, so only the id comes back
+        session_check = (await execute_query(
             supabase.table("chat_sessions")
-            .select("id, user_id, title")
+            .select("id")
             .eq("id", session_id)
-            .eq("user_id", user_id)  # Add user_id filter to make query more efficient
-            .execute()
-            .data
-        )
+            .eq("user_id", user_id)
+            .limit(1)
+        )).data
         
         if not session_check:
             raise ValueError("Chat session not found or you don't have permission to delete it")
         
         # Delete all messages in the session first (due to foreign key constraints)
-        messages_deleted = supabase.table("chat_messages").delete().eq("session_id", session_id).execute()
+        messages_deleted = await execute_query(supabase.table("chat_messages").delete().eq("session_id", session_id))
         
         # Delete the session
-        session_deleted = supabase.table("chat_sessions").delete().eq("id", session_id).execute()
+        session_deleted = await execute_query(
+            supabase.table("chat_sessions").delete().eq("id", session_id).eq("user_id", user_id)
+        )
         
         if not session_deleted.data:
             raise Exception("Failed to delete session")
@@ -944,7 +1070,7 @@ async def delete_chat_session_optimized(session_id: str, user_id: str) -> bool:
         return True
         
     except Exception as e:
-        print(f"Error deleting chat session: {e}")
+        logger.error("Error deleting chat session: %s", e)
         raise
 
 def enhance_response_formatting(response: str) -> str:
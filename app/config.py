@@ -26,6 +26,27 @@ class Settings(BaseSettings):
     supabase_edge_function_url: str = os.getenv("SUPABASE_EDGE_FUNCTION_URL", "https://your-project.supabase.co/functions/v1")
     supabase_edge_function_key: str = os.getenv("SUPABASE_EDGE_FUNCTION_KEY", "your_supabase_edge_function_key")
     
+    # Chat Rate Limiting
+    chat_rate_limit_per_minute: int = os.getenv("CHAT_RATE_LIMIT_PER_MINUTE", 20)
+    
+    # Semantic response cache for the first message of a chat
+    semantic_cache_enabled: bool = os.getenv("SEMANTIC_CACHE_ENABLED", True)
+    semantic_cache_threshold: float = os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.90)
+    semantic_cache_ttl: int = os.getenv("SEMANTIC_CACHE_TTL", 900)
+    embedding_model: str = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+    embedding_dimensions: int = os.getenv("EMBEDDING_DIMENSIONS", 512)
+    
+    # Supabase REST connection pool (per worker; idle timeout in seconds)
+    supabase_pool_max: int = os.getenv("SUPABASE_POOL_MAX", 20)
+    supabase_pool_idle_timeout: float = os.getenv("SUPABASE_POOL_IDLE_TIMEOUT", 30)
+    
+    # CORS: comma-separated list of allowed origins, or "*" for any origin
+    cors_allowed_origins: str = os.getenv("CORS_ALLOWED_ORIGINS", "*")
+    
+    # Logging
+    log_level: str = os.getenv("LOG_LEVEL", "INFO")
+    log_sample_rate: float = os.getenv("LOG_SAMPLE_RATE", 0.1)
+    
     class Config:
         env_file = ".env"
 
@@ -1,20 +1,102 @@
 from supabase import create_client, Client
+from postgrest.types import ReturnMethod
+from postgrest.exceptions import APIError
+from postgrest.utils import SyncClient as PostgrestSession
 from .config import settings
 from passlib.context import CryptContext
 from functools import lru_cache
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+import hashlib
+import anyio
+import httpx
 import asyncio
+import logging
 from typing import Optional, Dict, Any
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
+
+# Password hashing: new hashes use argon2id; existing bcrypt hashes still verify
+# and are upgraded on the user's next successful login. One lane per hash
+# (parallelism=1) at 64 MiB, so concurrent hashes spread across cores.
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    default="argon2",
+    deprecated="auto",
+    argon2__memory_cost=65536,
+    argon2__time_cost=2,
+    argon2__parallelism=1
+)
+
+# Hashing is CPU-bound but releases the GIL, so it runs on its own threads,
+# one per core, rather than taking threadpool slots needed for database I/O
+_password_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="password-hash")
+
+async def run_password_hashing(fn, *args):
+    """Run a pwd_context operation on the password hashing executor"""
+    return await asyncio.get_running_loop().run_in_executor(_password_executor, fn, *args)
+
+# Postgres SQLSTATE for a unique constraint violation
+UNIQUE_VIOLATION = "23505"
+
+# Columns of a users row the API actually reads; never the password hash
+USER_COLUMNS = "id, email, first_name, last_name, created_at, updated_at"
 
 # Supabase client with connection pooling
 @lru_cache(maxsize=1)
 def get_supabase() -> Client:
-    return create_client(
+    client = create_client(
         settings.supabase_url, 
         settings.supabase_anon_key
     )
+    
+    # Swap in a PostgREST session with a bounded pool, so bursts queue for a
+    # connection rather than opening up to httpx's default of 100 per worker
+    default_session = client.postgrest.session
+    client.postgrest.session = PostgrestSession(
+        base_url=default_session.base_url,
+        headers=default_session.headers,
+        timeout=default_session.timeout,
+        limits=httpx.Limits(
+            max_connections=settings.supabase_pool_max,
+            max_keepalive_connections=settings.supabase_pool_max,
+            keepalive_expiry=settings.supabase_pool_idle_timeout
+        )
+    )
+    default_session.close()
+    return client
+
+@lru_cache(maxsize=1)
+def _query_limiter() -> anyio.CapacityLimiter:
+    # Created lazily: anyio limiters must be built inside the event loop
+    return anyio.CapacityLimiter(settings.supabase_pool_max)
+
+async def warm_up_supabase():
+    """
+    Build the shared client at startup and open its pooled PostgREST
+    connection with one tiny query, so the first request skips both
+    """
+    try:
+        await execute_query(get_supabase().table("users").select("id").limit(1))
+    except Exception as e:
+        logger.warning("Supabase warm-up request failed: %s", e)
+
+def close_supabase():
+    """Close the shared client's PostgREST HTTP session"""
+    if get_supabase.cache_info().currsize:
+        # Despite its name, the sync client's aclose() closes synchronously
+        get_supabase().postgrest.aclose()
+
+async def execute_query(query):
+    """
+    Execute a Supabase query builder without blocking the event loop.
+    The Supabase client is synchronous, so the HTTP round trip runs in a worker
+    thread; at most one query per pooled connection runs at a time, and the
+    rest wait on the event loop instead of holding threads.
+    """
+    return await anyio.to_thread.run_sync(query.execute, limiter=_query_limiter())
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -22,25 +104,76 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+# Recently failed (email, password) pairs, so repeated bad attempts skip the
+# database and the hash. Keys are keyed-blake2b digests under a per-process
+# random key; only failures are ever stored, and only for a few seconds.
+_failed_logins: "OrderedDict[bytes, tuple]" = OrderedDict()
+_failed_logins_ttl = 5  # seconds
+_failed_logins_max_size = 50_000
+_failed_logins_key = os.urandom(32)
+# email -> its keys in _failed_logins, so clearing one email touches only those
+_failed_logins_by_email: Dict[str, set] = {}
+
+def _failed_login_key(email: str, password: str) -> bytes:
+    return hashlib.blake2b(f"{email}\0{password}".encode(), key=_failed_logins_key, digest_size=16).digest()
+
+def _record_failed_login(email: str, login_key: bytes):
+    _failed_logins[login_key] = (email, time.time() + _failed_logins_ttl)
+    _failed_logins.move_to_end(login_key)
+    _failed_logins_by_email.setdefault(email, set()).add(login_key)
+    if len(_failed_logins) > _failed_logins_max_size:
+        _drop_failed_login(next(iter(_failed_logins)))
+
+def _drop_failed_login(login_key: bytes):
+    """Remove one cached failure and its entry in the per-email index"""
+    email, _ = _failed_logins.pop(login_key)
+    email_keys = _failed_logins_by_email.get(email)
+    if email_keys is not None:
+        email_keys.discard(login_key)
+        if not email_keys:
+            del _failed_logins_by_email[email]
+
+def clear_failed_logins(email: str):
+    """Forget cached failures for an email, e.g. once it has been registered"""
+    for login_key in _failed_logins_by_email.pop(email, ()):
+        _failed_logins.pop(login_key, None)
+
 # Optimized user authentication with single database call
 async def authenticate_user_optimized(email: str, password: str) -> Optional[Dict[str, Any]]:
     """
     Optimized authentication that returns user data in a single database call
     """
+    login_key = _failed_login_key(email, password)
+    failed = _failed_logins.get(login_key)
+    if failed is not None:
+        if time.time() < failed[1]:
+            return None
+        _drop_failed_login(login_key)
+    
     supabase = get_supabase()
     try:
         # Single database call to get user with password verification
-        response = supabase.table("users").select("*").eq("email", email).execute()
+        response = await execute_query(supabase.table("users").select("id, email, password").eq("email", email))
         
         if not response.data:
+            _record_failed_login(email, login_key)
             return None
         
         user = response.data[0]
         
-        # Verify password
-        if not verify_password(password, user["password"]):
+        # Verify password off the event loop (hashing is deliberately CPU-heavy)
+        verified, new_hash = await run_password_hashing(pwd_context.verify_and_update, password, user["password"])
+        if not verified:
+            _record_failed_login(email, login_key)
             return None
         
+        # Re-hash legacy bcrypt passwords with the current default scheme
+        if new_hash:
+            try:
+                await execute_query(supabase.table("users").update({"password": new_hash}).eq("id", user["id"]))
+            except Exception as e:
+                logger.error("Error upgrading password hash: %s", e)
+        
         # Remove password from returned user data for security
         user.pop("password", None)
         return user
@@ -48,30 +181,90 @@ async def authenticate_user_optimized(email: str, password: str) -> Optional[Dic
     except Exception:
         return None
 
-# Cache for user data to reduce database calls
+class UserLookupBatcher:
+    """
+    Coalesce concurrent users-by-email lookups: every lookup that arrives within
+    one short window is answered by a single `in_` query
+    """
+    def __init__(self, window_ms: float = 8, max_batch: int = 100):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # In-flight batch queries, referenced until done so they are not garbage collected
+        self._tasks: set = set()
+    
+    async def lookup(self, email: str) -> Optional[Dict[str, Any]]:
+        future = self._pending.get(email)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[email] = loop.create_future()
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.window, self._flush)
+        # Shielded so one cancelled caller cannot cancel the result others share
+        return await asyncio.shield(future)
+    
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _run(self, batch: Dict[str, asyncio.Future]):
+        try:
+            response = await execute_query(get_supabase().table("users").select(USER_COLUMNS).in_("email", list(batch)))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        rows = {row["email"]: row for row in response.data}
+        for email, future in batch.items():
+            if not future.done():
+                future.set_result(rows.get(email))
+
+_user_lookup_batcher = UserLookupBatcher()
+
+# Cache for user data to reduce database calls; entries expire so profile
+# changes made elsewhere are picked up, and the size is capped
 _user_cache: Dict[str, Dict[str, Any]] = {}
+_user_cache_ttl = 600  # 10 minutes cache TTL for users
+_user_cache_max_size = 10_000
 
 async def get_user_by_email_cached(email: str) -> Optional[Dict[str, Any]]:
     """
     Get user by email with caching to reduce database calls
     """
     # Check cache first
-    if email in _user_cache:
-        return _user_cache[email]
+    cache_entry = _user_cache.get(email)
+    if cache_entry:
+        if time.time() - cache_entry['timestamp'] < _user_cache_ttl:
+            return cache_entry['data']
+        del _user_cache[email]
     
-    supabase = get_supabase()
     try:
-        response = supabase.table("users").select("*").eq("email", email).execute()
+        # Concurrent misses for different users share one query
+        user = await _user_lookup_batcher.lookup(email)
         
-        if not response.data:
+        if not user:
             return None
         
-        user = response.data[0]
         # Remove password from cached data
         user.pop("password", None)
         
-        # Cache the user data
-        _user_cache[email] = user
+        # Cache the user data, evicting the oldest entry when full
+        if len(_user_cache) >= _user_cache_max_size:
+            _user_cache.pop(next(iter(_user_cache)))
+        _user_cache[email] = {
+            'data': user,
+            'timestamp': time.time()
+        }
         
         return user
         
@@ -90,13 +283,13 @@ def clear_user_cache(email: str = None):
 # Optimized user registration with single database operation
 async def register_user_optimized(email: str, password: str, first_name: str, last_name: str) -> Optional[Dict[str, Any]]:
     """
-    Optimized user registration that uses a single database operation with conflict handling
+    Optimized user registration that uses a single database operation with conflict handling.
+    Returns None if the email is already registered.
     """
     supabase = get_supabase()
-    hashed_password = get_password_hash(password)
+    hashed_password = await run_password_hashing(get_password_hash, password)
     
     try:
-        # Use upsert with conflict resolution to handle race conditions
         new_user = {
             "email": email,
             "password": hashed_password,
@@ -104,23 +297,36 @@ async def register_user_optimized(email: str, password: str, first_name: str, la
             "last_name": last_name
         }
         
-        # Insert with conflict detection
-        response = supabase.table("users").insert(new_user).execute()
+        # INSERT ... ON CONFLICT (email) DO NOTHING: an existing email comes back
+        # as an empty result instead of an error, in the same single round trip.
+        # The row is returned by the insert itself (return=representation), pinned
+        # explicitly so no follow-up SELECT is ever needed.
+        response = await execute_query(
+            supabase.table("users").upsert(
+                new_user,
+                on_conflict="email",
+                ignore_duplicates=True,
+                returning=ReturnMethod.representation
+            )
+        )
         
         if not response.data:
             return None
         
+        # Attempts made before the account existed must not keep failing
+        clear_failed_logins(email)
+        
         created_user = response.data[0]
         # Remove password from returned data
         created_user.pop("password", None)
         
         return created_user
         
-    except Exception as e:
-        # Check if it's a unique constraint violation (email already exists)
-        if "duplicate key" in str(e).lower() or "unique constraint" in str(e).lower():
+    except APIError as e:
+        # Unique violation (a unique index on email other than the conflict target)
+        if e.code == UNIQUE_VIOLATION:
             return None  # User already exists
-        raise e
+        raise
 
 async def check_user_exists(email: str) -> bool:
     """
@@ -129,7 +335,7 @@ async def check_user_exists(email: str) -> bool:
     supabase = get_supabase()
     try:
         # Only select id to minimize data transfer
-        response = supabase.table("users").select("id").eq("email", email).limit(1).execute()
+        response = await execute_query(supabase.table("users").select("id").eq("email", email).limit(1))
         return len(response.data) > 0
     except Exception:
         return False
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, validator, Field
 from typing import Optional
-from datetime import datetime
+from datetime import date, datetime
 import re
 
 class UserBase(BaseModel):
@@ -65,6 +65,7 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     email: Optional[str] = None
+    user_id: Optional[str] = None
 
 class CreateSessionRequest(BaseModel):
     user_id: str = Field(..., min_length=1, description="User ID for the session")
@@ -133,4 +134,45 @@ class ChatDetailResponse(BaseModel):
     created_at: datetime
     user_id: str
     messages: list[ChatMessageResponse]
-    total_messages: int
\ No newline at end of file
+    total_messages: int
+
+
+class DateRangeToolArgs(BaseModel):
+    """Arguments of the Klaviyo tools that take an inclusive date range"""
+    start_date: date
+    end_date: date
+    
+    @validator('end_date')
+    def validate_range(cls, v, values):
+        """Reject ranges that end before they start"""
+        if 'start_date' in values and v < values['start_date']:
+            raise ValueError('end_date must not be before start_date')
+        return v
+
+class TopClickedUrlsArgs(DateRangeToolArgs):
+    limit: Optional[int] = Field(None, ge=1, le=20)
+
+class EventLogSliceArgs(DateRangeToolArgs):
+    event_type: Optional[str] = None
+    email: Optional[str] = None
+    limit: Optional[int] = Field(None, ge=1)
+
+class CampaignReasoningArgs(BaseModel):
+    """getCampaignReasoning takes a half-open date-time range"""
+    start_date: datetime
+    end_date: datetime
+    campaign_id: Optional[str] = None
+    
+    @validator('end_date')
+    def validate_range(cls, v, values):
+        """Reject empty or inverted ranges"""
+        if 'start_date' not in values:
+            return v
+        start, end = values['start_date'], v
+        # A bound without a timezone is read in the other bound's timezone
+        if (start.tzinfo is None) != (end.tzinfo is None):
+            start = start.replace(tzinfo=start.tzinfo or end.tzinfo)
+            end = end.replace(tzinfo=end.tzinfo or start.tzinfo)
+        if end <= start:
+            raise ValueError('end_date must be after start_date')
+        return v
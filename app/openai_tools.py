@@ -0,0 +1,605 @@
+import orjson
+
+# OpenAI function-calling schema for the Supabase Edge Functions the chat assistant can call
+tools = [
+    # Review Management Functions
+    {
+        "type": "function",
+        "function": {
+            "name": "fetchLatestOkendoReviews",
+            "description": "Fetch latest Okendo product reviews with pagination and sorting. Use this when users ask for recent reviews, want to see the latest feedback, or need paginated review data.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "limit": {
+                        "type": "integer",
+                        "description": "Number of reviews to return (default: 10, max: 50)"
+                    },
+                    "offset": {
+                        "type": "integer",
+                        "description": "Number of reviews to skip for pagination (default: 0)"
+                    },
+                    "sort_by": {
+                        "type": "string",
+                        "enum": ["date_created", "rating", "helpful_votes"],
+                        "description": "Field to sort reviews by (default: date_created)"
+                    },
+                    "order": {
+                        "type": "string",
+                        "enum": ["asc", "desc"],
+                        "description": "Sort order - ascending or descending (default: desc)"
+                    }
+                }
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "getReviewsByRatingRange",
+            "description": "Filter reviews by rating range to identify patterns in low or high-rated feedback. Use this when users ask for reviews within specific rating ranges or want to analyze sentiment patterns.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "min_rating": {
+                        "type": "number",
+                        "minimum": 1,
+                        "maximum": 5,
+                        "description": "Minimum rating value (1-5)"
+                    },
+                    "max_rating": {
+                        "type": "number",
+                        "minimum": 1,
+                        "maximum": 5,
+                        "description": "Maximum rating value (1-5, must be >= min_rating)"
+                    }
+                },
+                "required": ["min_rating", "max_rating"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "getReviewsByKeyword",
+            "description": "Search customer reviews that mention specific words or topics. Great for identifying trends or recurring issues mentioned in feedback.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "keyword": {
+                        "type": "string",
+                        "description": "Word or phrase to search for in review content"
+                    }
+                },
+                "required": ["keyword"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "getReviewsByDateRange",
+            "description": "Retrieve product reviews submitted within a specific date range. Useful for analyzing recent customer sentiment or evaluating campaign performance.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "start_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "Start date in YYYY-MM-DD format"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "End date in YYYY-MM-DD format"
+                    }
+                },
+                "required": ["start_date", "end_date"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "getReviewSummaryByProductName",
+            "description": "Get an aggregated review summary for a specific product, including average rating and review count.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "product_name": {
+                        "type": "string",
+                        "description": "Name of the product to get review summary for"
+                    }
+                },
+                "required": ["product_name"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "getSentimentSummary",
+            "description": "Fetch reviews grouped or filtered by sentiment (positive, neutral, negative). Helps identify customer tone and sentiment trends.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "range": {
+                        "type": "string",
+                        "enum": ["this_week", "last_week", "this_month", "custom"],
+                        "description": "Preset date range. If omitted, defaults to the latest 7 days."
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "Start date for custom range (required if range is 'custom')"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "End date for custom range (required if range is 'custom')"
+                    }
+                }
+            }
+        }
+    },
+    
+    # Order Management Functions
+    {
+        "type": "function",
+        "function": {
+            "name": "getOrdersOverTime",
+            "description": "Visualize order volume trends over time. Helps detect growth, spikes, or drop-offs. Use this when users ask about order trends, growth patterns, or time-based order analytics.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "interval": {
+                        "type": "string",
+                        "enum": ["day", "week", "month"],
+                        "description": "Time grouping interval. Choose 'day' for daily trends, 'week' for weekly patterns, or 'month' for monthly overview. Analyze the user's request to determine the most appropriate interval."
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "Start date in YYYY-MM-DD format. For relative time references (e.g., 'last week', 'past 2 weeks'), calculate from TODAY's current date. CRITICAL: Always use current year unless explicitly requested otherwise."
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "End date in YYYY-MM-DD format. For relative time references, this is typically TODAY's date. For specific periods, use the end date mentioned in the user's request. CRITICAL: Always use the current year unless explicitly requested otherwise."
+                    },
+                    "currency": {
+                        "type": "string",
+                        "description": "Currency code for monetary calculations (e.g., 'USD', 'EUR', 'CAD'). ONLY include if user specifically mentions a currency."
+                    }
+                },
+                "required": ["interval"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "getOrdersByStatus",
+            "description": "Filter and count orders by their status like completed, pending, or cancelled. Use this when users ask about order status breakdowns, fulfillment tracking, or support issues related to order status.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "status_type": {
+                        "type": "string",
+                        "enum": ["financial", "fulfillment"],
+                        "description": "Type of status to group by. Use 'financial' for payment status or 'fulfillment' for shipping status."
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "Start date in YYYY-MM-DD format. ONLY include if user specifically requests a time period."
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "End date in YYYY-MM-DD format. ONLY include if user specifically requests a time period."
+                    },
+                    "currency": {
+                        "type": "string",
+                        "description": "Currency code for monetary calculations. ONLY include if user specifically mentions a currency."
+                    }
+                },
+                "required": ["status_type"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "getOrderDetails",
+            "description": "Retrieve detailed information about a specific order by order ID. Use this when users ask for full order details, customer info, or line item breakdowns.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "order_id": {
+                        "type": "string",
+                        "description": "Order number, e.g., 7754 or #7754"
+                    }
+                },
+                "required": ["order_id"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "getTopProducts",
+            "description": "List the best-selling products by total sales or units sold. Useful for merchandising and stock planning decisions.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of top products to return (default: 5, max: 50)"
+                    }
+                }
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "getLineItemAggregates",
+            "description": "Get top Shopify metrics (products, SKUs, vendors, etc.) by date range. Returns aggregated order line item metrics within specified dates.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "metric": {
+                        "type": "string",
+                        "enum": ["top_products", "top_skus", "top_variants", "top_vendors", "top_payment_gateways"],
+                        "description": "The metric to aggregate (default: top_products)"
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "Start date (inclusive) in YYYY-MM-DD format"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "End date (inclusive) in YYYY-MM-DD format"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Number of results to return (max: 50, default: 5)"
+                    }
+                },
+                "required": ["start_date", "end_date"]
+            }
+        }
+    },
+    
+    # Discount Analysis Functions
+    {
+        "type": "function",
+        "function": {
+            "name": "getDiscountUsage",
+            "description": "Track how often discount codes were used, and total revenue impact. Use this for discount strategy analysis and performance tracking.",
+            "parameters": {
+                "type": "object",
+                "properties": {}
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "getOrdersWithDiscounts",
+            "description": "Get a list of orders where discount codes were applied. Use this to analyze discount effectiveness and customer behavior.",
+            "parameters": {
+                "type": "object",
+                "properties": {}
+            }
+        }
+    },
+    
+    # Customer Management Functions
+    {
+        "type": "function",
+        "function": {
+            "name": "getCustomers",
+            "description": "Retrieve a list of all customers and their basic info. Use this for customer database overview and basic customer information.",
+            "parameters": {
+                "type": "object",
+                "properties": {}
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "getInactiveCustomers",
+            "description": "Find customers who haven't placed an order recently. Helps with re-engagement campaigns and customer lifecycle management.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "days": {
+                        "type": "integer",
+                        "description": "Number of days to check inactivity (default: 30)"
+                    }
+                }
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "getCustomerOrders",
+            "description": "Fetch order history for a specific customer. Use this for customer support, order tracking, and customer relationship management.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "email": {
+                        "type": "string",
+                        "format": "email",
+                        "description": "The email of the customer (use either email OR customer_id, not both)"
+                    },
+                    "customer_id": {
+                        "type": "string",
+                        "description": "The Shopify customer ID (use either email OR customer_id, not both)"
+                    }
+                }
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "getCustomersStats",
+            "description": "Get customer statistics such as counts, averages, or raw data. Use this for customer analytics and performance metrics.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "metric": {
+                        "type": "string",
+                        "enum": ["count", "average", "default"],
+                        "description": "The type of metric to return (default: default)"
+                    },
+                    "field": {
+                        "type": "string",
+                        "description": "The field to calculate average on (used only when metric = 'average'). Example: total_spent."
+                    },
+                    "from": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "Start date in YYYY-MM-DD format. Defaults to 7 days ago if not provided."
+                    },
+                    "to": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "End date in YYYY-MM-DD format. Defaults to today if not provided."
+                    }
+                }
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "getTopCustomersRepeatFrequency",
+            "description": "Fetch top customers ranked by spend and their repeat order frequency metrics. Use this for customer loyalty analysis and retention insights.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "top_n": {
+                        "type": "integer",
+                        "description": "Number of top customers to return, defaults to 10"
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "Optional start date filter (YYYY-MM-DD)"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "Optional end date filter (YYYY-MM-DD)"
+                    },
+                    "customer_emails": {
+                        "type": "array",
+                        "items": {
+                            "type": "string",
+                            "format": "email"
+                        },
+                        "description": "Optional list of customer emails to restrict results"
+                    }
+                }
+            }
+        }
+    },
+    
+    # Analytics Functions
+    {
+        "type": "function",
+        "function": {
+            "name": "getPostPurchaseInsights",
+            "description": "Analyze open-ended survey feedback from customers after purchase to detect common themes or sentiment. Use this for customer experience improvement.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "question": {
+                        "type": "string",
+                        "description": "User's query, e.g., 'Summarize July feedback about pricing.'"
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "Optional start date for filtering responses"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "Optional end date for filtering responses"
+                    }
+                },
+                "required": ["question"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "orchestrator",
+            "description": "Process natural language Shopify analytics query. This is a high-level orchestrator that can route complex queries to appropriate functions and synthesize results.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "User's natural language question about Shopify analytics"
+                    }
+                },
+                "required": ["query"]
+            }
+        }
+    },
+    
+    # Klaviyo Event Analytics Functions
+    {
+        "type": "function",
+        "function": {
+            "name": "getEventCounts",
+            "description": "Fetch counts of events by type within a specified date range. Use this to analyze event patterns and understand user behavior across different event types.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "start_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "Start date (inclusive) as a concrete YYYY-MM-DD date; resolve relative phrases like 'today' first"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "End date (inclusive) as a concrete YYYY-MM-DD date; resolve relative phrases like 'today' first"
+                    }
+                },
+                "required": ["start_date", "end_date"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "getEmailEventRatios",
+            "description": "Get email engagement ratios including open rate, click rate, and click-to-open rate. Use this to analyze email campaign performance and engagement metrics.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "start_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "Start date (inclusive) as a concrete YYYY-MM-DD date; resolve relative phrases like 'today' first"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "End date (inclusive) as a concrete YYYY-MM-DD date; resolve relative phrases like 'today' first"
+                    }
+                },
+                "required": ["start_date", "end_date"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "getTopClickedUrls",
+            "description": "Get the most clicked URLs from email campaigns. Use this to identify which links are most engaging and optimize email content.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "start_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "Start date (inclusive) as a concrete YYYY-MM-DD date; resolve relative phrases like 'today' first"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "End date (inclusive) as a concrete YYYY-MM-DD date; resolve relative phrases like 'today' first"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Number of top URLs to return (default: 3, max: 20)"
+                    }
+                },
+                "required": ["start_date", "end_date"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "getCampaignReasoning",
+            "description": "Get campaign engagement reasoning and daily trends. Use this to understand campaign performance patterns and identify factors affecting engagement rates.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "start_date": {
+                        "type": "string",
+                        "format": "date-time",
+                        "description": "Start of the range (inclusive) as a concrete ISO 8601 date-time"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "format": "date-time",
+                        "description": "End of the range (exclusive) as a concrete ISO 8601 date-time; to include a whole day, use the next day at 00:00:00"
+                    },
+                    "campaign_id": {
+                        "type": "string",
+                        "description": "Optional campaign ID to filter results"
+                    }
+                },
+                "required": ["start_date", "end_date"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "getEventLogSlice",
+            "description": "Get a filtered set of event log data with campaign and device insights. Use this to analyze specific event types, user behavior, and campaign performance.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "start_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "Start date (inclusive) as a concrete YYYY-MM-DD date; resolve relative phrases like 'today' first"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "End date (inclusive) as a concrete YYYY-MM-DD date; resolve relative phrases like 'today' first"
+                    },
+                    "event_type": {
+                        "type": "string",
+                        "description": "Type of event to filter (e.g., 'Clicked Email', 'Opened Email')"
+                    },
+                    "email": {
+                        "type": "string",
+                        "description": "Email address to filter by (partial match supported)"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of events to return (default: 10)"
+                    }
+                },
+                "required": ["start_date", "end_date"]
+            }
+        }
+    }
+]
+
+# Encoded once at import. TOOLS_PAYLOAD is the JSON-ready copy sent with each
+# completion request through extra_body, which the OpenAI SDK passes through as
+# is instead of re-walking the whole schema against its typed params every call.
+# Every request shares this one object, so callers must never modify it.
+TOOLS_JSON_BYTES = orjson.dumps(tools)
+TOOLS_PAYLOAD = orjson.loads(TOOLS_JSON_BYTES)
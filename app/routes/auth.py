@@ -1,22 +1,36 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
-from fastapi.responses import JSONResponse
+from postgrest.exceptions import APIError
 from ..models import UserCreate, UserLogin, UserResponse, Token
-from ..database import get_supabase, get_password_hash, authenticate_user_optimized, register_user_optimized, check_user_exists
-from ..auth import create_access_token, get_current_user, logout_user
-from datetime import timedelta
+from ..database import get_supabase, execute_query, authenticate_user_optimized, register_user_optimized
+from ..auth import create_access_token, get_current_user, get_current_user_id, logout_user
 from ..config import settings
 import time
+import httpx
+import random
 import hashlib
 import json
+import logging
 from typing import Dict, Optional
-from collections import defaultdict
-from datetime import datetime, timedelta
+from collections import OrderedDict, deque
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
+logger = logging.getLogger(__name__)
+
+# Fixed error response arguments; see the note in app/routes/chat.py
+REGISTRATION_RATE_LIMITED = dict(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many registration attempts. Please try again later.")
+EMAIL_ALREADY_REGISTERED = dict(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
+REGISTRATION_FAILED = dict(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create user. Please try again.")
+INVALID_CREDENTIALS = dict(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect email or password", headers={"WWW-Authenticate": "Bearer"})
+NO_VALID_UPDATE_FIELDS = dict(status_code=status.HTTP_400_BAD_REQUEST, detail="No valid fields to update")
+PROFILE_UPDATE_NOT_APPLIED = dict(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to update user profile")
+PROFILE_UPDATE_FAILED = dict(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to update profile. Please try again.")
 
 # Simple in-memory rate limiting (in production, use Redis or similar)
-_registration_attempts: Dict[str, list] = defaultdict(list)
 _max_attempts_per_hour = 5
+# Monotonic timestamps of recent attempts per client; never holds more than the limit.
+# Clients are kept in LRU order and capped so spraying source addresses cannot grow it without bound
+_registration_attempts: "OrderedDict[str, deque]" = OrderedDict()
+_registration_attempts_max_size = 50_000
 
 # Cache for user profile responses with ETag support
 _user_profile_cache: Dict[str, Dict] = {}
@@ -26,21 +40,26 @@ def check_rate_limit(client_ip: str) -> bool:
     """
     Check if client has exceeded rate limit for registration attempts
     """
-    now = datetime.now()
-    hour_ago = now - timedelta(hours=1)
+    now = time.monotonic()
+    hour_ago = now - 3600
+    attempts = _registration_attempts.get(client_ip)
+    if attempts is None:
+        attempts = _registration_attempts[client_ip] = deque(maxlen=_max_attempts_per_hour)
+        while len(_registration_attempts) > _registration_attempts_max_size:
+            _registration_attempts.popitem(last=False)
+    else:
+        _registration_attempts.move_to_end(client_ip)
     
-    # Clean old attempts
-    _registration_attempts[client_ip] = [
-        attempt_time for attempt_time in _registration_attempts[client_ip]
-        if attempt_time > hour_ago
-    ]
+    # Clean old attempts (oldest first, so stop at the first recent one)
+    while attempts and attempts[0] <= hour_ago:
+        attempts.popleft()
     
     # Check if under limit
-    if len(_registration_attempts[client_ip]) >= _max_attempts_per_hour:
+    if len(attempts) >= _max_attempts_per_hour:
         return False
     
     # Record this attempt
-    _registration_attempts[client_ip].append(now)
+    attempts.append(now)
     return True
 
 def generate_etag(user_data: dict) -> str:
@@ -100,10 +119,7 @@ async def register(user: UserCreate, request: Request):
     
     # Check rate limit
     if not check_rate_limit(client_ip):
-        raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail="Too many registration attempts. Please try again later."
-        )
+        raise HTTPException(**REGISTRATION_RATE_LIMITED)
     
     try:
         # Use optimized registration function
@@ -113,36 +129,22 @@ async def register(user: UserCreate, request: Request):
             first_name=user.first_name,
             last_name=user.last_name
         )
-        
-        if not created_user:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email already registered"
-            )
-        
-        # Log registration time for monitoring
-        registration_time = (time.time() - start_time) * 1000
-        print(f"Registration completed in {registration_time:.2f}ms for {user.email}")
-        
-        return UserResponse(
-            id=created_user["id"],
-            email=created_user["email"],
-            first_name=created_user["first_name"],
-            last_name=created_user["last_name"],
-            created_at=created_user["created_at"],
-            updated_at=created_user["updated_at"]
-        )
-        
-    except HTTPException:
-        # Re-raise HTTP exceptions as-is
-        raise
-    except Exception as e:
-        # Log the actual error for debugging (in production, use proper logging)
-        print(f"Registration error: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to create user. Please try again."
-        )
+    except (APIError, httpx.HTTPError) as e:
+        # Database rejected the insert or was unreachable; anything else is a
+        # bug and goes to the global handler with its traceback
+        logger.error("Registration error: %s", e)
+        raise HTTPException(**REGISTRATION_FAILED) from None
+    
+    if not created_user:
+        raise HTTPException(**EMAIL_ALREADY_REGISTERED)
+    
+    # Log registration time for monitoring
+    registration_time = (time.time() - start_time) * 1000
+    logger.info("Registration completed in %.2fms for %s", registration_time, user.email)
+    
+    # response_model validates and filters the row once; building a
+    # UserResponse here as well would validate it twice
+    return created_user
 
 @router.post("/login", response_model=Token)
 async def login(user_credentials: UserLogin):
@@ -154,16 +156,10 @@ async def login(user_credentials: UserLogin):
     """
     user = await authenticate_user_optimized(user_credentials.email, user_credentials.password)
     if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect email or password",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise HTTPException(**INVALID_CREDENTIALS)
     
-    access_token_expires = timedelta(minutes=settings.jwt_expire_minutes)
-    access_token = create_access_token(
-        data={"sub": user["email"]}, expires_delta=access_token_expires
-    )
+    # Default lifetime (settings.jwt_expire_minutes), precomputed in app.auth
+    access_token = create_access_token(data={"sub": user["email"], "uid": user["id"]})
     
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -203,7 +199,7 @@ async def get_user_profile(
         
         # Log performance
         processing_time = (time.time() - start_time) * 1000
-        print(f"User profile served from cache in {processing_time:.2f}ms for user {user_id}")
+        logger.debug("User profile served from cache in %.2fms for user %s", processing_time, user_id)
         
         return cached_data['user_data']
     
@@ -233,13 +229,15 @@ async def get_user_profile(
     
     # Log performance
     processing_time = (time.time() - start_time) * 1000
-    print(f"User profile generated in {processing_time:.2f}ms for user {user_id}")
+    if random.random() < settings.log_sample_rate:
+        logger.info("User profile generated in %.2fms for user %s", processing_time, user_id)
     
     return user_response
 
 @router.get("/verify")
-async def verify_token_validity(current_user: dict = Depends(get_current_user)):
-    return {"valid": True, "user_id": current_user["id"]}
+async def verify_token_validity(user_id: str = Depends(get_current_user_id)):
+    """Token check answered from the JWT's uid claim, without loading the user"""
+    return {"valid": True, "user_id": user_id}
 
 @router.post("/logout")
 async def logout(current_user: dict = Depends(get_current_user)):
@@ -268,20 +266,14 @@ async def update_user_profile(
         filtered_data = {k: v for k, v in update_data.items() if k in allowed_fields}
         
         if not filtered_data:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="No valid fields to update"
-            )
+            raise HTTPException(**NO_VALID_UPDATE_FIELDS)
         
         # Update user in database
         supabase = get_supabase()
-        response = supabase.table("users").update(filtered_data).eq("id", current_user["id"]).execute()
+        response = await execute_query(supabase.table("users").update(filtered_data).eq("id", current_user["id"]))
         
         if not response.data:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to update user profile"
-            )
+            raise HTTPException(**PROFILE_UPDATE_NOT_APPLIED)
         
         # Clear profile cache since data has changed
         clear_user_profile_cache(current_user["id"])
@@ -291,8 +283,5 @@ async def update_user_profile(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Profile update error: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to update profile. Please try again."
-        )
+        logger.error("Profile update error: %s", e)
+        raise HTTPException(**PROFILE_UPDATE_FAILED)
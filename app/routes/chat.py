@@ -1,56 +1,211 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
-from fastapi.responses import StreamingResponse
-from app.chat import create_session_optimized, call_openai_streaming, get_user_chat_sessions_optimized, delete_chat_session_optimized, get_chat_detail, get_chat_detail_optimized, get_session_info
-from app.auth import get_current_user
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from app.chat import create_session_optimized, call_openai_streaming, get_user_chat_sessions_optimized, delete_chat_session_optimized, get_chat_detail_optimized, get_chat_messages_page, get_session_info
+from app.auth import get_current_user_id, verify_token
+from starlette.datastructures import Headers, QueryParams
 from ..models import ChatRequest, CreateSessionRequest, CreateSessionResponse, ChatSessionsListResponse, ChatDetailResponse
-from ..database import get_supabase
+from ..database import get_supabase, execute_query
+from ..config import settings
+from ..openai_tools import TOOLS_PAYLOAD
+import re
+import sys
 import time
-import json
+import random
+import logging
+import orjson
+import hashlib
 import asyncio
-from typing import Dict, Optional
-from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict, defaultdict, deque
+from itertools import count, islice
 
 router = APIRouter(prefix="/chat", tags=["chatbot"])
 
-# Cache for sessions list responses
-_sessions_cache: Dict[str, Dict] = {}
+logger = logging.getLogger(__name__)
+
+# Fixed error responses. Only their arguments are shared: each raise builds a
+# fresh HTTPException, since a raised instance keeps its traceback (and the
+# request's frames) alive and would be overwritten by concurrent requests
+SESSION_ID_REQUIRED = dict(status_code=status.HTTP_400_BAD_REQUEST, detail="Session ID is required")
+DELETE_SESSION_NOT_FOUND = dict(status_code=status.HTTP_404_NOT_FOUND, detail="Chat session not found or you don't have permission to delete it")
+DELETE_SESSION_FAILED = dict(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to delete session")
+INVALID_SESSION_ID = dict(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid session ID")
+INVALID_JSON_BODY = dict(status_code=status.HTTP_400_BAD_REQUEST, detail="Request body must be valid JSON")
+SESSION_IDS_REQUIRED = dict(status_code=status.HTTP_400_BAD_REQUEST, detail="session_ids array is required")
+BULK_DELETE_LIMIT_EXCEEDED = dict(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot delete more than 50 sessions at once")
+CREATE_SESSION_USER_MISMATCH = dict(status_code=status.HTTP_403_FORBIDDEN, detail="User ID mismatch - you can only create sessions for yourself")
+SESSION_CREATION_RATE_LIMITED = dict(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many session creation attempts. Please try again later.")
+CHAT_USER_MISMATCH = dict(status_code=status.HTTP_403_FORBIDDEN, detail="User ID mismatch - you can only send messages for yourself")
+MESSAGE_REQUIRED = dict(status_code=status.HTTP_400_BAD_REQUEST, detail="Message content is required")
+MAX_MESSAGE_LEN = 4000  # Reasonable limit for chat messages
+MESSAGE_TOO_LONG = dict(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Message is too long (max {MAX_MESSAGE_LEN} characters)")
+SESSION_NOT_FOUND = dict(status_code=status.HTTP_404_NOT_FOUND, detail="Chat session not found")
+
+# Cache for sessions list responses (LRU, bounded so page scans cannot grow it forever)
+# Keys are tuples whose first element is the owning user_id
+_sessions_cache: "OrderedDict[Tuple, Dict]" = OrderedDict()
 _sessions_cache_ttl = 60  # 1 minute cache TTL for sessions
+_sessions_cache_max_size = 10_000
+_sessions_cache_eviction_sample = 32  # LRU-end entries considered per eviction
+# user_id -> keys currently cached for that user, so invalidation touches only those
+_sessions_cache_user_keys: Dict[str, set] = defaultdict(set)
+# Cache key -> database fetch currently running for it, shared by concurrent misses
+_sessions_in_flight: Dict[Tuple, Tuple[Tuple[int, int], asyncio.Task]] = {}
+# user_id -> generation, bumped by every invalidation: a fetch that started before
+# a write must not put its (stale) result into the cache after the write cleared it
+_sessions_cache_generations: "OrderedDict[str, int]" = OrderedDict()
+_sessions_cache_generations_max_size = 50_000
+_sessions_cache_generation_counter = count(1)
+_sessions_cache_epoch = 0  # bumped when the whole cache is cleared
 
 # Rate limiting for session creation (per 1 hour)
 _max_session_creation_per_hour = 20
 
 # Note: Rate limiting now counts existing sessions, not creation attempts
 
-def generate_sessions_cache_key(user_id: str, page: int, pagination: int) -> str:
-    """Generate cache key for sessions list"""
-    return f"sessions:{user_id}:{page}:{pagination}"
+# Server-sent event framing, encoded once; start/complete events only fill in their values
+SSE_PREFIX = b"data: "
+SSE_SUFFIX = b"\n\n"
+SSE_START_PREFIX = b'data: {"type":"start","timestamp":"'
+SSE_COMPLETE_PREFIX = b'data: {"type":"complete","processing_time_ms":'
+SSE_EVENT_END = b'"}\n\n'
 
-def get_cached_sessions(cache_key: str) -> Optional[Dict]:
-    """Get cached sessions data if still valid"""
+# Session ids must be 1-64 letters, digits, "_" or "-" (UUIDs included); one
+# precompiled fullmatch checks that in a single pass
+_ID_RE = re.compile(r"[A-Za-z0-9_\-]{1,64}")
+
+# Maximum concurrent deletes issued by one bulk delete request
+_bulk_delete_concurrency = 10
+
+# Chat detail histories longer than one page are streamed page by page
+_detail_page_size = 200
+
+# Per-user fixed-window rate limiting for chat messages (in production, use Redis or similar)
+# Kept in LRU order and capped so a spray of distinct user ids cannot grow it without bound
+_chat_rate_windows: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()
+_chat_rate_windows_max_size = 50_000
+
+def generate_sessions_cache_key(user_id: str, page: int, pagination: int) -> Tuple[str, int, int]:
+    """Generate cache key for sessions list (a tuple: no string building, cheap hashing)"""
+    return (sys.intern(user_id), page, pagination)
+
+def get_cached_sessions_entry(cache_key: Tuple) -> Optional[Dict]:
+    """Get the whole cache entry (data plus metadata such as etag) if still valid"""
     if cache_key in _sessions_cache:
         cache_entry = _sessions_cache[cache_key]
-        if time.time() - cache_entry['timestamp'] < _sessions_cache_ttl:
-            return cache_entry['data']
+        now = time.time()
+        if now - cache_entry['timestamp'] < _sessions_cache_ttl:
+            cache_entry['accesses'].append(now)
+            _sessions_cache.move_to_end(cache_key)
+            return cache_entry
         else:
-            del _sessions_cache[cache_key]
+            _drop_sessions_cache_key(cache_key)
     return None
 
-def cache_sessions(cache_key: str, data: dict):
-    """Cache sessions data"""
+def get_cached_sessions(cache_key: Tuple) -> Optional[Dict]:
+    """Get cached sessions data if still valid"""
+    cache_entry = get_cached_sessions_entry(cache_key)
+    return cache_entry['data'] if cache_entry else None
+
+def _drop_sessions_cache_key(cache_key: Tuple):
+    """Remove one entry from the cache and from its owner's key index"""
+    del _sessions_cache[cache_key]
+    user_keys = _sessions_cache_user_keys.get(cache_key[0])
+    if user_keys is not None:
+        user_keys.discard(cache_key)
+        if not user_keys:
+            del _sessions_cache_user_keys[cache_key[0]]
+
+def _evict_sessions_cache_entry():
+    """
+    LRU-2 eviction: among the least recently used entries, evict one that was
+    only touched once (e.g. a page visited during a scan) before any entry with
+    a second access, otherwise the one whose second-to-last access is oldest
+    """
+    candidates = islice(_sessions_cache.items(), _sessions_cache_eviction_sample)
+    victim_key, _ = min(
+        candidates,
+        key=lambda item: item[1]['accesses'][0] if len(item[1]['accesses']) == 2 else float("-inf")
+    )
+    _drop_sessions_cache_key(victim_key)
+
+def sessions_cache_generation(user_id: str) -> Tuple[int, int]:
+    """Current cache generation for a user; record it before fetching data to cache"""
+    return (_sessions_cache_epoch, _sessions_cache_generations.get(user_id, 0))
+
+def cache_sessions(cache_key: Tuple, data: dict, etag: Optional[str] = None, generation: Optional[Tuple[int, int]] = None):
+    """
+    Cache sessions data, evicting with LRU-2 when full. With a generation (taken
+    before the fetch), nothing is cached if the user's entries were invalidated since.
+    """
+    if generation is not None and generation != sessions_cache_generation(cache_key[0]):
+        return
     _sessions_cache[cache_key] = {
         'data': data,
-        'timestamp': time.time()
+        'etag': etag,
+        'timestamp': time.time(),
+        'accesses': deque([time.time()], maxlen=2)
     }
+    _sessions_cache.move_to_end(cache_key)
+    _sessions_cache_user_keys[cache_key[0]].add(cache_key)
+    # Cache helpers never await, so the event loop cannot interleave them; no lock needed
+    if len(_sessions_cache) > _sessions_cache_max_size:
+        _evict_sessions_cache_entry()
+
+def generate_etag(data: dict) -> str:
+    """Generate ETag for response data to support conditional requests"""
+    return f'"{hashlib.md5(orjson.dumps(data, option=orjson.OPT_SORT_KEYS)).hexdigest()}"'
+
+def not_modified(request: Request, etag: str) -> bool:
+    """Whether the client already holds the representation identified by etag"""
+    return request.headers.get("if-none-match") == etag
 
 def clear_sessions_cache(user_id: str = None):
-    """Clear sessions cache (useful when sessions are created/updated/deleted)"""
+    """
+    Clear sessions cache (useful when sessions are created/updated/deleted).
+    Write paths call this before their response completes, not as a background
+    task: a client that lists sessions right after a write must not be served
+    the stale cached page, and with the per-user key index the call is cheap.
+    """
+    global _sessions_cache_epoch
     if user_id:
-        # Clear all cache entries for this user
-        keys_to_remove = [key for key in _sessions_cache.keys() if f"sessions:{user_id}:" in key]
-        for key in keys_to_remove:
-            del _sessions_cache[key]
+        # Clear all cache entries for this user: O(entries for the user), O(1) when none
+        for key in _sessions_cache_user_keys.pop(user_id, ()):
+            _sessions_cache.pop(key, None)
+        # Results of fetches already running for this user are no longer cacheable
+        _sessions_cache_generations[user_id] = next(_sessions_cache_generation_counter)
+        _sessions_cache_generations.move_to_end(user_id)
+        if len(_sessions_cache_generations) > _sessions_cache_generations_max_size:
+            _sessions_cache_generations.popitem(last=False)
+        # Fetches started before the write must not be joined by requests made after it
+        for key in [k for k in _sessions_in_flight if k[0] == user_id]:
+            del _sessions_in_flight[key]
     else:
         _sessions_cache.clear()
+        _sessions_cache_user_keys.clear()
+        _sessions_in_flight.clear()
+        _sessions_cache_epoch += 1
+
+def fetch_sessions_page(user_id: str, page: int, pagination: int, cache_key: Tuple) -> Tuple[Tuple[int, int], asyncio.Task]:
+    """
+    Return the database fetch for a sessions page, starting one only if no
+    request for the same page is already waiting on it (singleflight), along
+    with the cache generation the fetch started in
+    """
+    in_flight = _sessions_in_flight.get(cache_key)
+    if in_flight is None:
+        generation = sessions_cache_generation(user_id)
+        task = asyncio.ensure_future(get_user_chat_sessions_optimized(user_id, page, pagination))
+        in_flight = _sessions_in_flight[cache_key] = (generation, task)
+        
+        def forget(done_task: asyncio.Task):
+            current = _sessions_in_flight.get(cache_key)
+            if current is not None and current[1] is done_task:
+                del _sessions_in_flight[cache_key]
+        
+        task.add_done_callback(forget)
+    return in_flight
 
 
 async def check_session_creation_rate_limit(user_id: str) -> bool:
@@ -62,100 +217,114 @@ async def check_session_creation_rate_limit(user_id: str) -> bool:
     try:
         supabase = get_supabase()
         
-        # Get all sessions for this user in the last 1 hour using a more robust approach
-        # First, get current timestamp and calculate 1 hour ago
-        # Use UTC time to match database timestamps
-        now = datetime.utcnow()
-        hour_ago = now - timedelta(hours=1)
-        
-        # Try multiple datetime formats to ensure compatibility
-        formats_to_try = [
-            hour_ago.strftime("%Y-%m-%dT%H:%M:%S"),
-            hour_ago.strftime("%Y-%m-%d %H:%M:%S"),
-            hour_ago.isoformat(),
-            hour_ago.strftime("%Y-%m-%dT%H:%M:%S.%f")
-        ]
-        
-        recent_sessions_count = 0
-        
-        for fmt in formats_to_try:
-            try:
-                response = (
-                    supabase.table("chat_sessions")
-                    .select("id", count="exact")
-                    .eq("user_id", user_id)
-                    .gte("created_at", fmt)
-                    .execute()
-                )
-                
-                count = response.count or 0
-                
-                if count > 0:
-                    recent_sessions_count = count
-                    break
-                    
-            except Exception:
-                continue
+        # A timezone-aware ISO timestamp compares correctly against timestamptz,
+        # so a single count query covers the window
+        hour_ago = datetime.now(timezone.utc) - timedelta(hours=1)
         
-        # If all formats failed, try a different approach - get all recent sessions and filter in Python
-        if recent_sessions_count == 0:
-            fallback_time = (now - timedelta(hours=2)).strftime("%Y-%m-%dT%H:%M:%S")
-            all_recent = (
-                supabase.table("chat_sessions")
-                .select("id, created_at")
-                .eq("user_id", user_id)
-                .gte("created_at", fallback_time)
-                .order("created_at", desc=True)
-                .limit(50)
-                .execute()
-            )
-            
-            if all_recent.data:
-                recent_sessions_count = 0
-                for session in all_recent.data:
-                    try:
-                        session_time = datetime.fromisoformat(session['created_at'].replace('Z', ''))
-                        if session_time >= hour_ago:
-                            recent_sessions_count += 1
-                    except Exception:
-                        continue
-        
-        # Additional safety check: if we still can't get a proper count, use a simpler approach
-        if recent_sessions_count == 0:
-            today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            
-            today_response = (
-                supabase.table("chat_sessions")
-                .select("id", count="exact")
-                .eq("user_id", user_id)
-                .gte("created_at", today_start.strftime("%Y-%m-%dT%H:%M:%S"))
-                .execute()
-            )
-            
-            today_count = today_response.count or 0
-            
-            # DISABLED: Don't apply rate limit based on today's sessions for testing
-            # Only use the 1-hour window rate limiting
+        response = await execute_query(
+            supabase.table("chat_sessions")
+            .select("id", count="exact")
+            .eq("user_id", user_id)
+            .gte("created_at", hour_ago.isoformat())
+            .limit(1)
+        )
+        recent_sessions_count = response.count or 0
         
         # Check if under limit
-        if recent_sessions_count >= _max_session_creation_per_hour:
-            return False
-        else:
-            return True
+        return recent_sessions_count < _max_session_creation_per_hour
         
     except Exception as e:
-        print(f"❌ Error checking session creation rate limit: {e}")
+        logger.warning("Error checking session creation rate limit: %s", e)
         # If there's an error, allow the request to proceed (fail open)
         return True
 
 
-@router.get("/sessions", response_model=ChatSessionsListResponse)
+async def enforce_chat_rate_limit(user_id: str = Depends(get_current_user_id)) -> str:
+    """
+    Cap chat messages per user per minute so one client cannot exhaust
+    workers or the OpenAI budget
+    """
+    now = int(time.time())
+    window = now // 60
+    
+    current_window, count = _chat_rate_windows.get(user_id, (window, 0))
+    if current_window != window:
+        count = 0
+    
+    if count >= settings.chat_rate_limit_per_minute:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many chat messages. Please wait a moment and try again.",
+            headers={"Retry-After": str(60 - now % 60)}
+        )
+    
+    _chat_rate_windows[user_id] = (window, count + 1)
+    _chat_rate_windows.move_to_end(user_id)
+    while len(_chat_rate_windows) > _chat_rate_windows_max_size:
+        _chat_rate_windows.popitem(last=False)
+    return user_id
+
+
+def normalize_pagination(page: int, pagination: int) -> Tuple[int, int]:
+    """Clamp pagination parameters to the values the sessions endpoint serves"""
+    if page < 1:
+        page = 1
+    if pagination < 1 or pagination > 100:
+        pagination = 10
+    return page, pagination
+
+def cached_sessions_response(cache_entry: Dict, if_none_match: Optional[str]) -> Response:
+    """Build the response for a cached sessions page"""
+    headers = {"X-Cache": "HIT", "Cache-Control": "private, max-age=60", "ETag": cache_entry['etag']}
+    
+    # Client already has this page: skip the body entirely
+    if if_none_match == cache_entry['etag']:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    return Response(content=cache_entry['data'], media_type="application/json", headers=headers)
+
+def sessions_fast_path_response(scope) -> Optional[Response]:
+    """
+    Answer GET /chat/sessions from the cache before routing, dependency injection
+    and validation run. Returns None whenever the request needs the full route:
+    missing or invalid token, token without a uid claim, unparseable query, or a miss.
+    """
+    headers = Headers(scope=scope)
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    
+    # Signature and expiry are checked here exactly as in get_current_user_id
+    try:
+        token_data = verify_token(token)
+    except HTTPException:
+        return None
+    if not token_data.user_id:
+        return None
+    
+    query_params = QueryParams(scope.get("query_string", b""))
+    try:
+        page = int(query_params.get("page", 1))
+        pagination = int(query_params.get("pagination", 20))
+    except ValueError:
+        return None
+    page, pagination = normalize_pagination(page, pagination)
+    
+    cache_entry = get_cached_sessions_entry(generate_sessions_cache_key(token_data.user_id, page, pagination))
+    if cache_entry is None:
+        return None
+    
+    logger.debug("Sessions served from fast path for user %s", token_data.user_id)
+    return cached_sessions_response(cache_entry, headers.get("if-none-match"))
+
+# The listing is cached as serialized JSON, so cache hits send stored bytes
+# without re-validating or re-encoding; ChatSessionsListResponse documents the shape
+@router.get("/sessions", response_class=ORJSONResponse, responses={200: {"model": ChatSessionsListResponse}})
 async def get_chat_sessions(
     request: Request,
-    response: Response,
     page: int = 1, 
     pagination: int = 20, 
-    current_user: dict = Depends(get_current_user)
+    user_id: str = Depends(get_current_user_id)
 ):
     """
     Optimized endpoint to get paginated chat sessions with caching and performance improvements:
@@ -166,64 +335,144 @@ async def get_chat_sessions(
     """
     start_time = time.time()
     
-    try:
-        # Validate pagination parameters
-        if page < 1:
-            page = 1
-        if pagination < 1 or pagination > 100:
-            pagination = 10
-        
-        # Use user ID directly from JWT token (no need for additional DB query)
-        user_id = current_user["id"]
-        
-        # Generate cache key
-        cache_key = generate_sessions_cache_key(user_id, page, pagination)
-        
-        # Check cache first
-        cached_data = get_cached_sessions(cache_key)
-        if cached_data:
-            # Set cache headers
-            response.headers["X-Cache"] = "HIT"
-            response.headers["Cache-Control"] = "private, max-age=60"
-            
-            processing_time = (time.time() - start_time) * 1000
-            print(f"Sessions served from cache in {processing_time:.2f}ms for user {user_id}")
-            
-            # Ensure user_id is included in cached data for validation
-            cached_data_with_user_id = {**cached_data, "user_id": user_id}
-            return ChatSessionsListResponse(**cached_data_with_user_id)
-        
-        # Get paginated chat sessions using optimized function
-        result = await get_user_chat_sessions_optimized(user_id, page, pagination)
-        
-        # Add user_id to result for caching
-        result_with_user_id = {**result, "user_id": user_id}
-        
-        # Cache the result
-        cache_sessions(cache_key, result_with_user_id)
-        
-        # Set response headers
-        response.headers["X-Cache"] = "MISS"
-        response.headers["Cache-Control"] = "private, max-age=60"
-        
-        # Log performance
+    # Validate pagination parameters
+    page, pagination = normalize_pagination(page, pagination)
+    
+    # Generate cache key
+    cache_key = generate_sessions_cache_key(user_id, page, pagination)
+    
+    # Check cache first (usually already answered by the fast path in front of routing)
+    cache_entry = get_cached_sessions_entry(cache_key)
+    if cache_entry:
         processing_time = (time.time() - start_time) * 1000
-        print(f"Sessions generated in {processing_time:.2f}ms for user {user_id} (page {page})")
-        
-        return ChatSessionsListResponse(**result_with_user_id)
+        logger.debug("Sessions served from cache in %.2fms for user %s", processing_time, user_id)
         
-    except Exception as e:
-        print(f"Error retrieving chat sessions: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to retrieve chat sessions"
+        return cached_sessions_response(cache_entry, request.headers.get("if-none-match"))
+    
+    # Pages past the end of a known total are empty; answer them without a DB call
+    total_key = (user_id, "total")
+    known_total = get_cached_sessions(total_key)
+    if known_total is not None and page > 1 and (page - 1) * pagination >= known_total:
+        total_pages = (known_total + pagination - 1) // pagination
+        return ORJSONResponse(
+            {
+                "user_id": user_id,
+                "sessions": [],
+                "total_sessions": known_total,
+                "page": page,
+                "pagination": pagination,
+                "total_pages": total_pages,
+                "has_next": False,
+                "has_prev": True
+            },
+            headers={"X-Cache": "HIT", "Cache-Control": "private, max-age=60"}
         )
+    
+    # Get paginated chat sessions, sharing the fetch with concurrent misses for
+    # the same page; shielded so one client disconnecting cannot cancel it for the rest
+    generation, task = fetch_sessions_page(user_id, page, pagination, cache_key)
+    result = await asyncio.shield(task)
+    
+    # Remember the total so out-of-range pages can be answered from memory
+    cache_sessions(total_key, result["total_sessions"], generation=generation)
+    
+    # Serialize once; the same bytes (and their ETag) are cached and sent
+    body = orjson.dumps({"user_id": user_id, **result})
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    
+    # Cache the result
+    cache_sessions(cache_key, body, etag, generation=generation)
+    
+    # Log performance
+    processing_time = (time.time() - start_time) * 1000
+    if random.random() < settings.log_sample_rate:
+        logger.info("Sessions generated in %.2fms for user %s (page %s)", processing_time, user_id, page)
+    
+    headers = {"X-Cache": "MISS", "Cache-Control": "private, max-age=60", "ETag": etag}
+    if not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.delete("/sessions/bulk")
+async def bulk_delete_sessions(
+    request: Request,
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    Optimized endpoint to delete multiple chat sessions at once
+    """
+    start_time = time.time()
+    
+    # Get session IDs from request body (parsed straight from the raw bytes with orjson)
+    try:
+        body = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(**INVALID_JSON_BODY)
+    session_ids = body.get("session_ids", []) if isinstance(body, dict) else None
+    
+    if not session_ids or not isinstance(session_ids, list):
+        raise HTTPException(**SESSION_IDS_REQUIRED)
+    
+    if len(session_ids) > 50:  # Limit bulk operations
+        raise HTTPException(**BULK_DELETE_LIMIT_EXCEEDED)
+    
+    deleted_sessions = []
+    failed_sessions = []
+    
+    # Strip and validate once up front, and drop duplicates so a retried ID is deleted only once
+    valid_ids = []
+    seen_ids = set()
+    for session_id in session_ids:
+        cleaned_id = session_id.strip() if isinstance(session_id, str) else ""
+        if not _ID_RE.fullmatch(cleaned_id):
+            failed_sessions.append({"session_id": session_id, "error": "Invalid session ID"})
+        elif cleaned_id not in seen_ids:
+            seen_ids.add(cleaned_id)
+            valid_ids.append(cleaned_id)
+    
+    # Delete sessions in parallel, capped so one request cannot monopolize the threadpool
+    semaphore = asyncio.Semaphore(_bulk_delete_concurrency)
+    
+    async def delete_one(session_id: str) -> bool:
+        async with semaphore:
+            return await delete_chat_session_optimized(session_id, user_id)
+    
+    results = await asyncio.gather(
+        *(delete_one(session_id) for session_id in valid_ids),
+        return_exceptions=True
+    )
+    
+    for session_id, result in zip(valid_ids, results):
+        if isinstance(result, Exception):
+            failed_sessions.append({"session_id": session_id, "error": str(result)})
+        elif result:
+            deleted_sessions.append(session_id)
+        else:
+            failed_sessions.append({"session_id": session_id, "error": "Failed to delete"})
+    
+    # Clear sessions cache for this user
+    clear_sessions_cache(user_id)
+    
+    # Log performance
+    processing_time = (time.time() - start_time) * 1000
+    logger.info(
+        "Bulk delete completed in %.2fms for user %s: %d deleted, %d failed",
+        processing_time, user_id, len(deleted_sessions), len(failed_sessions)
+    )
+    
+    return {
+        "message": f"Bulk delete completed: {len(deleted_sessions)} sessions deleted",
+        "deleted_sessions": deleted_sessions,
+        "failed_sessions": failed_sessions,
+        "total_requested": len(session_ids),
+        "deleted_at": datetime.now().isoformat()
+    }
 
 @router.delete("/sessions/{session_id}")
 async def delete_chat_session_endpoint(
     session_id: str, 
     request: Request,
-    current_user: dict = Depends(get_current_user)
+    user_id: str = Depends(get_current_user_id)
 ):
     """
     Optimized endpoint to delete a specific chat session with enhanced performance:
@@ -235,144 +484,44 @@ async def delete_chat_session_endpoint(
     """
     start_time = time.time()
     
+    # Validate session_id format
+    if not _ID_RE.fullmatch(session_id):
+        raise HTTPException(**INVALID_SESSION_ID)
+    
+    # Delete the session using optimized function
     try:
-        # Use user ID directly from JWT token (no need for additional DB query)
-        user_id = current_user["id"]
-        
-        # Validate session_id format
-        if not session_id or not session_id.strip():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Session ID is required"
-            )
-        
-        session_id = session_id.strip()
-        
-        # Delete the session using optimized function
         success = await delete_chat_session_optimized(session_id, user_id)
-        
-        if not success:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to delete session"
-            )
-        
-        # Clear sessions cache for this user since we deleted a session
-        clear_sessions_cache(user_id)
-        
-        # Log performance
-        processing_time = (time.time() - start_time) * 1000
-        print(f"Session deleted in {processing_time:.2f}ms for user {user_id}")
-        
-        return {
-            "message": "Chat session deleted successfully", 
-            "session_id": session_id,
-            "deleted_at": datetime.now().isoformat()
-        }
-        
-    except HTTPException:
-        # Re-raise HTTP exceptions as-is
-        raise
     except ValueError as e:
         # Handle specific validation errors
         error_msg = str(e).lower()
         if "not found" in error_msg or "permission" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Chat session not found or you don't have permission to delete it"
-            )
-        elif "required" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=str(e)
-            )
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=str(e)
-            )
-    except Exception as e:
-        print(f"Error deleting chat session: {str(e)}")
+            raise HTTPException(**DELETE_SESSION_NOT_FOUND)
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to delete chat session. Please try again."
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
-
-@router.delete("/sessions/bulk")
-async def bulk_delete_sessions(
-    request: Request,
-    current_user: dict = Depends(get_current_user)
-):
-    """
-    Optimized endpoint to delete multiple chat sessions at once
-    """
-    start_time = time.time()
     
-    try:
-        # Get session IDs from request body
-        body = await request.json()
-        session_ids = body.get("session_ids", [])
-        
-        if not session_ids or not isinstance(session_ids, list):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="session_ids array is required"
-            )
-        
-        if len(session_ids) > 50:  # Limit bulk operations
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Cannot delete more than 50 sessions at once"
-            )
-        
-        user_id = current_user["id"]
-        deleted_sessions = []
-        failed_sessions = []
-        
-        # Delete sessions in parallel
-        for session_id in session_ids:
-            try:
-                if not session_id or not session_id.strip():
-                    failed_sessions.append({"session_id": session_id, "error": "Invalid session ID"})
-                    continue
-                
-                success = await delete_chat_session_optimized(session_id.strip(), user_id)
-                if success:
-                    deleted_sessions.append(session_id)
-                else:
-                    failed_sessions.append({"session_id": session_id, "error": "Failed to delete"})
-            except Exception as e:
-                failed_sessions.append({"session_id": session_id, "error": str(e)})
-        
-        # Clear sessions cache for this user
-        clear_sessions_cache(user_id)
-        
-        # Log performance
-        processing_time = (time.time() - start_time) * 1000
-        print(f"Bulk delete completed in {processing_time:.2f}ms for user {user_id}: {len(deleted_sessions)} deleted, {len(failed_sessions)} failed")
-        
-        return {
-            "message": f"Bulk delete completed: {len(deleted_sessions)} sessions deleted",
-            "deleted_sessions": deleted_sessions,
-            "failed_sessions": failed_sessions,
-            "total_requested": len(session_ids),
-            "deleted_at": datetime.now().isoformat()
-        }
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"Error in bulk delete: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to perform bulk delete operation"
-        )
+    if not success:
+        raise HTTPException(**DELETE_SESSION_FAILED)
+    
+    # Clear sessions cache for this user since we deleted a session
+    clear_sessions_cache(user_id)
+    
+    # Log performance
+    processing_time = (time.time() - start_time) * 1000
+    logger.info("Session deleted in %.2fms for user %s", processing_time, user_id)
+    
+    return {
+        "message": "Chat session deleted successfully", 
+        "session_id": session_id,
+        "deleted_at": datetime.now().isoformat()
+    }
 
-@router.post("/create_chat", response_model=CreateSessionResponse)
+@router.post("/create_chat", response_class=ORJSONResponse, responses={200: {"model": CreateSessionResponse}})
 async def create_chat(
     req: CreateSessionRequest, 
     request: Request,
-    current_user: dict = Depends(get_current_user)
+    authenticated_user_id: str = Depends(get_current_user_id)
 ):
     """
     Optimized endpoint to create a new chat session with enhanced performance:
@@ -384,665 +533,43 @@ async def create_chat(
     """
     start_time = time.time()
     
-    try:
-        # Use user ID directly from JWT token (no need for additional DB query)
-        authenticated_user_id = current_user["id"]
-        
-        # Validate user_id matches authenticated user
-        if req.user_id != authenticated_user_id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="User ID mismatch - you can only create sessions for yourself"
-            )
-        
-        # Check rate limit for session creation
-        if not await check_session_creation_rate_limit(authenticated_user_id):
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail="Too many session creation attempts. Please try again later."
-            )
-        
-        # Validate title if provided
-        if req.title:
-            req.title = req.title.strip()
-            if len(req.title) > 200:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Session title must be 200 characters or less"
-                )
-        
-        # Create session using optimized function
-        session = await create_session_optimized(req.user_id, req.title)
-        
-        # Clear sessions cache for this user since we added a new session
-        clear_sessions_cache(authenticated_user_id)
-        
-        # Log performance
-        processing_time = (time.time() - start_time) * 1000
-        print(f"Session created in {processing_time:.2f}ms for user {authenticated_user_id}")
-        
-        return CreateSessionResponse(
-            session_id=session["id"],
-            user_id=session["user_id"],
-            title=session["title"],
-            created_at=session["created_at"]
-        )
-        
-    except HTTPException:
-        # Re-raise HTTP exceptions as-is
-        raise
-    except Exception as e:
-        print(f"Error creating chat session: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to create session. Please try again."
-        )
-
-tools = [
-    # Review Management Functions
-    {
-        "type": "function",
-        "function": {
-            "name": "fetchLatestOkendoReviews",
-            "description": "Fetch latest Okendo product reviews with pagination and sorting. Use this when users ask for recent reviews, want to see the latest feedback, or need paginated review data.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "limit": {
-                        "type": "integer",
-                        "description": "Number of reviews to return (default: 10, max: 50)"
-                    },
-                    "offset": {
-                        "type": "integer",
-                        "description": "Number of reviews to skip for pagination (default: 0)"
-                    },
-                    "sort_by": {
-                        "type": "string",
-                        "enum": ["date_created", "rating", "helpful_votes"],
-                        "description": "Field to sort reviews by (default: date_created)"
-                    },
-                    "order": {
-                        "type": "string",
-                        "enum": ["asc", "desc"],
-                        "description": "Sort order - ascending or descending (default: desc)"
-                    }
-                }
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "getReviewsByRatingRange",
-            "description": "Filter reviews by rating range to identify patterns in low or high-rated feedback. Use this when users ask for reviews within specific rating ranges or want to analyze sentiment patterns.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "min_rating": {
-                        "type": "number",
-                        "minimum": 1,
-                        "maximum": 5,
-                        "description": "Minimum rating value (1-5)"
-                    },
-                    "max_rating": {
-                        "type": "number",
-                        "minimum": 1,
-                        "maximum": 5,
-                        "description": "Maximum rating value (1-5, must be >= min_rating)"
-                    }
-                },
-                "required": ["min_rating", "max_rating"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "getReviewsByKeyword",
-            "description": "Search customer reviews that mention specific words or topics. Great for identifying trends or recurring issues mentioned in feedback.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "keyword": {
-                        "type": "string",
-                        "description": "Word or phrase to search for in review content"
-                    }
-                },
-                "required": ["keyword"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "getReviewsByDateRange",
-            "description": "Retrieve product reviews submitted within a specific date range. Useful for analyzing recent customer sentiment or evaluating campaign performance.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "start_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "Start date in YYYY-MM-DD format"
-                    },
-                    "end_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "End date in YYYY-MM-DD format"
-                    }
-                },
-                "required": ["start_date", "end_date"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "getReviewSummaryByProductName",
-            "description": "Get an aggregated review summary for a specific product, including average rating and review count.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "product_name": {
-                        "type": "string",
-                        "description": "Name of the product to get review summary for"
-                    }
-                },
-                "required": ["product_name"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "getSentimentSummary",
-            "description": "Fetch reviews grouped or filtered by sentiment (positive, neutral, negative). Helps identify customer tone and sentiment trends.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "range": {
-                        "type": "string",
-                        "enum": ["this_week", "last_week", "this_month", "custom"],
-                        "description": "Preset date range. If omitted, defaults to the latest 7 days."
-                    },
-                    "start_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "Start date for custom range (required if range is 'custom')"
-                    },
-                    "end_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "End date for custom range (required if range is 'custom')"
-                    }
-                }
-            }
-        }
-    },
+    # Validate user_id matches authenticated user
+    if req.user_id != authenticated_user_id:
+        raise HTTPException(**CREATE_SESSION_USER_MISMATCH)
     
-    # Order Management Functions
-    {
-        "type": "function",
-        "function": {
-            "name": "getOrdersOverTime",
-            "description": "Visualize order volume trends over time. Helps detect growth, spikes, or drop-offs. Use this when users ask about order trends, growth patterns, or time-based order analytics.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "interval": {
-                        "type": "string",
-                        "enum": ["day", "week", "month"],
-                        "description": "Time grouping interval. Choose 'day' for daily trends, 'week' for weekly patterns, or 'month' for monthly overview. Analyze the user's request to determine the most appropriate interval."
-                    },
-                    "start_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "Start date in YYYY-MM-DD format. For relative time references (e.g., 'last week', 'past 2 weeks'), calculate from TODAY's current date. CRITICAL: Always use current year unless explicitly requested otherwise."
-                    },
-                    "end_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "End date in YYYY-MM-DD format. For relative time references, this is typically TODAY's date. For specific periods, use the end date mentioned in the user's request. CRITICAL: Always use the current year unless explicitly requested otherwise."
-                    },
-                    "currency": {
-                        "type": "string",
-                        "description": "Currency code for monetary calculations (e.g., 'USD', 'EUR', 'CAD'). ONLY include if user specifically mentions a currency."
-                    }
-                },
-                "required": ["interval"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "getOrdersByStatus",
-            "description": "Filter and count orders by their status like completed, pending, or cancelled. Use this when users ask about order status breakdowns, fulfillment tracking, or support issues related to order status.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "status_type": {
-                        "type": "string",
-                        "enum": ["financial", "fulfillment"],
-                        "description": "Type of status to group by. Use 'financial' for payment status or 'fulfillment' for shipping status."
-                    },
-                    "start_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "Start date in YYYY-MM-DD format. ONLY include if user specifically requests a time period."
-                    },
-                    "end_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "End date in YYYY-MM-DD format. ONLY include if user specifically requests a time period."
-                    },
-                    "currency": {
-                        "type": "string",
-                        "description": "Currency code for monetary calculations. ONLY include if user specifically mentions a currency."
-                    }
-                },
-                "required": ["status_type"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "getOrderDetails",
-            "description": "Retrieve detailed information about a specific order by order ID. Use this when users ask for full order details, customer info, or line item breakdowns.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "order_id": {
-                        "type": "string",
-                        "description": "Order number, e.g., 7754 or #7754"
-                    }
-                },
-                "required": ["order_id"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "getTopProducts",
-            "description": "List the best-selling products by total sales or units sold. Useful for merchandising and stock planning decisions.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "limit": {
-                        "type": "integer",
-                        "description": "Maximum number of top products to return (default: 5, max: 50)"
-                    }
-                }
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "getLineItemAggregates",
-            "description": "Get top Shopify metrics (products, SKUs, vendors, etc.) by date range. Returns aggregated order line item metrics within specified dates.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "metric": {
-                        "type": "string",
-                        "enum": ["top_products", "top_skus", "top_variants", "top_vendors", "top_payment_gateways"],
-                        "description": "The metric to aggregate (default: top_products)"
-                    },
-                    "start_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "Start date (inclusive) in YYYY-MM-DD format"
-                    },
-                    "end_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "End date (inclusive) in YYYY-MM-DD format"
-                    },
-                    "limit": {
-                        "type": "integer",
-                        "description": "Number of results to return (max: 50, default: 5)"
-                    }
-                },
-                "required": ["start_date", "end_date"]
-            }
-        }
-    },
+    # Check rate limit for session creation
+    if not await check_session_creation_rate_limit(authenticated_user_id):
+        raise HTTPException(**SESSION_CREATION_RATE_LIMITED)
     
-    # Discount Analysis Functions
-    {
-        "type": "function",
-        "function": {
-            "name": "getDiscountUsage",
-            "description": "Track how often discount codes were used, and total revenue impact. Use this for discount strategy analysis and performance tracking.",
-            "parameters": {
-                "type": "object",
-                "properties": {}
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "getOrdersWithDiscounts",
-            "description": "Get a list of orders where discount codes were applied. Use this to analyze discount effectiveness and customer behavior.",
-            "parameters": {
-                "type": "object",
-                "properties": {}
-            }
-        }
-    },
+    # Title is already stripped and length-checked by CreateSessionRequest
+    # Create session using optimized function
+    session = await create_session_optimized(req.user_id, req.title)
     
-    # Customer Management Functions
-    {
-        "type": "function",
-        "function": {
-            "name": "getCustomers",
-            "description": "Retrieve a list of all customers and their basic info. Use this for customer database overview and basic customer information.",
-            "parameters": {
-                "type": "object",
-                "properties": {}
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "getInactiveCustomers",
-            "description": "Find customers who haven't placed an order recently. Helps with re-engagement campaigns and customer lifecycle management.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "days": {
-                        "type": "integer",
-                        "description": "Number of days to check inactivity (default: 30)"
-                    }
-                }
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "getCustomerOrders",
-            "description": "Fetch order history for a specific customer. Use this for customer support, order tracking, and customer relationship management.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "email": {
-                        "type": "string",
-                        "format": "email",
-                        "description": "The email of the customer (use either email OR customer_id, not both)"
-                    },
-                    "customer_id": {
-                        "type": "string",
-                        "description": "The Shopify customer ID (use either email OR customer_id, not both)"
-                    }
-                }
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "getCustomersStats",
-            "description": "Get customer statistics such as counts, averages, or raw data. Use this for customer analytics and performance metrics.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "metric": {
-                        "type": "string",
-                        "enum": ["count", "average", "default"],
-                        "description": "The type of metric to return (default: default)"
-                    },
-                    "field": {
-                        "type": "string",
-                        "description": "The field to calculate average on (used only when metric = 'average'). Example: total_spent."
-                    },
-                    "from": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "Start date in YYYY-MM-DD format. Defaults to 7 days ago if not provided."
-                    },
-                    "to": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "End date in YYYY-MM-DD format. Defaults to today if not provided."
-                    }
-                }
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "getTopCustomersRepeatFrequency",
-            "description": "Fetch top customers ranked by spend and their repeat order frequency metrics. Use this for customer loyalty analysis and retention insights.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "top_n": {
-                        "type": "integer",
-                        "description": "Number of top customers to return, defaults to 10"
-                    },
-                    "start_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "Optional start date filter (YYYY-MM-DD)"
-                    },
-                    "end_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "Optional end date filter (YYYY-MM-DD)"
-                    },
-                    "customer_emails": {
-                        "type": "array",
-                        "items": {
-                            "type": "string",
-                            "format": "email"
-                        },
-                        "description": "Optional list of customer emails to restrict results"
-                    }
-                }
-            }
-        }
-    },
+    # Clear sessions cache for this user since we added a new session
+    clear_sessions_cache(authenticated_user_id)
     
-    # Analytics Functions
-    {
-        "type": "function",
-        "function": {
-            "name": "getPostPurchaseInsights",
-            "description": "Analyze open-ended survey feedback from customers after purchase to detect common themes or sentiment. Use this for customer experience improvement.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "question": {
-                        "type": "string",
-                        "description": "User's query, e.g., 'Summarize July feedback about pricing.'"
-                    },
-                    "start_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "Optional start date for filtering responses"
-                    },
-                    "end_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "Optional end date for filtering responses"
-                    }
-                },
-                "required": ["question"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "orchestrator",
-            "description": "Process natural language Shopify analytics query. This is a high-level orchestrator that can route complex queries to appropriate functions and synthesize results.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": "User's natural language question about Shopify analytics"
-                    }
-                },
-                "required": ["query"]
-            }
-        }
-    },
+    # Log performance
+    processing_time = (time.time() - start_time) * 1000
+    logger.info("Session created in %.2fms for user %s", processing_time, authenticated_user_id)
     
-    # Klaviyo Event Analytics Functions
-    {
-        "type": "function",
-        "function": {
-            "name": "getEventCounts",
-            "description": "Fetch counts of events by type within a specified date range. Use this to analyze event patterns and understand user behavior across different event types.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "start_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "Start date (inclusive) in YYYY-MM-DD format"
-                    },
-                    "end_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "End date (inclusive) in YYYY-MM-DD format"
-                    }
-                },
-                "required": ["start_date", "end_date"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "getEmailEventRatios",
-            "description": "Get email engagement ratios including open rate, click rate, and click-to-open rate. Use this to analyze email campaign performance and engagement metrics.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "start_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "Start date in YYYY-MM-DD format"
-                    },
-                    "end_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "End date in YYYY-MM-DD format"
-                    }
-                },
-                "required": ["start_date", "end_date"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "getTopClickedUrls",
-            "description": "Get the most clicked URLs from email campaigns. Use this to identify which links are most engaging and optimize email content.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "start_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "Start date in YYYY-MM-DD format"
-                    },
-                    "end_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "End date in YYYY-MM-DD format"
-                    },
-                    "limit": {
-                        "type": "integer",
-                        "description": "Number of top URLs to return (default: 3, max: 20)"
-                    }
-                },
-                "required": ["start_date", "end_date"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "getCampaignReasoning",
-            "description": "Get campaign engagement reasoning and daily trends. Use this to understand campaign performance patterns and identify factors affecting engagement rates.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "start_date": {
-                        "type": "string",
-                        "format": "date-time",
-                        "description": "Start date in ISO 8601 format"
-                    },
-                    "end_date": {
-                        "type": "string",
-                        "format": "date-time",
-                        "description": "End date in ISO 8601 format"
-                    },
-                    "campaign_id": {
-                        "type": "string",
-                        "description": "Optional campaign ID to filter results"
-                    }
-                },
-                "required": ["start_date", "end_date"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "getEventLogSlice",
-            "description": "Get a filtered set of event log data with campaign and device insights. Use this to analyze specific event types, user behavior, and campaign performance.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "start_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "Start date in YYYY-MM-DD format"
-                    },
-                    "end_date": {
-                        "type": "string",
-                        "format": "date",
-                        "description": "End date in YYYY-MM-DD format"
-                    },
-                    "event_type": {
-                        "type": "string",
-                        "description": "Type of event to filter (e.g., 'Clicked Email', 'Opened Email')"
-                    },
-                    "email": {
-                        "type": "string",
-                        "description": "Email address to filter by (partial match supported)"
-                    },
-                    "limit": {
-                        "type": "integer",
-                        "description": "Maximum number of events to return (default: 10)"
-                    }
-                },
-                "required": ["start_date", "end_date"]
-            }
-        }
-    }
-]
+    # The row was just written by us, so skip re-validating it through the response model
+    return ORJSONResponse({
+        "session_id": session["id"],
+        "user_id": session["user_id"],
+        "title": session["title"],
+        "created_at": session["created_at"]
+    })
 
 @router.post("/chat")
 async def chat(
     req: ChatRequest, 
     request: Request,
-    current_user: dict = Depends(get_current_user)
+    authenticated_user_id: str = Depends(enforce_chat_rate_limit)
 ):
     """
     Streaming chat endpoint with real-time token-by-token response:
     - Real-time streaming responses like ChatGPT
+    - Per-user rate limiting
     - Enhanced input validation
     - Performance monitoring and logging
     - Tool execution progress updates
@@ -1050,143 +577,113 @@ async def chat(
     """
     start_time = time.time()
     
-    try:
-        # Use user ID directly from JWT token (no need for additional DB query)
-        authenticated_user_id = current_user["id"]
-        
-        # Validate user_id matches authenticated user
-        if req.user_id != authenticated_user_id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="User ID mismatch - you can only send messages for yourself"
-            )
-        
-        # Validate message content
-        if not req.message or not req.message.strip():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Message content is required"
-            )
-        
-        # Validate session_id
-        if not req.session_id or not req.session_id.strip():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Session ID is required"
-            )
-        
-        # Trim and validate message length
-        req.message = req.message.strip()
-        if len(req.message) > 4000:  # Reasonable limit for chat messages
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Message is too long (max 4000 characters)"
+    # Validate user_id matches authenticated user
+    if req.user_id != authenticated_user_id:
+        raise HTTPException(**CHAT_USER_MISMATCH)
+    
+    # Trim once, then validate message content
+    req.message = req.message.strip() if req.message else ""
+    if not req.message:
+        raise HTTPException(**MESSAGE_REQUIRED)
+    
+    # Validate session_id
+    if not req.session_id or not req.session_id.strip():
+        raise HTTPException(**SESSION_ID_REQUIRED)
+    
+    # Validate message length
+    if len(req.message) > MAX_MESSAGE_LEN:
+        raise HTTPException(**MESSAGE_TOO_LONG)
+    
+    # Create streaming response generator
+    async def generate_stream():
+        try:
+            # Send start event
+            yield SSE_START_PREFIX + datetime.now().isoformat().encode() + SSE_EVENT_END
+            
+            # Process chat message using streaming function; StreamingResponse
+            # sends each frame as it is yielded, so no explicit flush is needed
+            async for chunk in call_openai_streaming(req.message, TOOLS_PAYLOAD, req.session_id, req.user_id):
+                yield SSE_PREFIX + orjson.dumps(chunk) + SSE_SUFFIX
+            
+            # Send completion event
+            processing_time = (time.time() - start_time) * 1000
+            yield (
+                SSE_COMPLETE_PREFIX + orjson.dumps(round(processing_time, 2))
+                + b',"timestamp":"' + datetime.now().isoformat().encode() + SSE_EVENT_END
             )
-        
-        # Create streaming response generator
-        async def generate_stream():
-            try:
-                # Send start event
-                start_event = f"data: {json.dumps({'type': 'start', 'timestamp': datetime.now().isoformat()})}\n\n"
-                yield start_event
-                
-                # Process chat message using streaming function
-                async for chunk in call_openai_streaming(req.message, tools, req.session_id, req.user_id):
-                    chunk_data = f"data: {json.dumps(chunk)}\n\n"
-                    yield chunk_data
-                    # Force immediate flush for real-time streaming
-                    await asyncio.sleep(0)  # Yield control to allow immediate sending
-                
-                # Send completion event
-                processing_time = (time.time() - start_time) * 1000
-                complete_event = f"data: {json.dumps({'type': 'complete', 'processing_time_ms': round(processing_time, 2), 'timestamp': datetime.now().isoformat()})}\n\n"
-                yield complete_event
-                
-                print(f"Chat streamed in {processing_time:.2f}ms for user {authenticated_user_id}")
-                
-            except Exception as e:
-                error_msg = f"Error in streaming chat: {str(e)}"
-                print(error_msg)
-                error_event = f"data: {json.dumps({'type': 'error', 'error': error_msg})}\n\n"
-                yield error_event
-        
-        return StreamingResponse(
-            generate_stream(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache, no-store, must-revalidate",
-                "Pragma": "no-cache",
-                "Expires": "0",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no",  # Disable nginx buffering
-            }
-        )
-        
-    except HTTPException:
-        # Re-raise HTTP exceptions as-is
-        raise
-    except Exception as e:
-        print(f"Error processing chat message: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to process chat message. Please try again."
-        )
+            
+            if random.random() < settings.log_sample_rate:
+                logger.info("Chat streamed in %.2fms for user %s", processing_time, authenticated_user_id)
+            
+        except Exception as e:
+            error_msg = f"Error in streaming chat: {str(e)}"
+            logger.error(error_msg)
+            yield SSE_PREFIX + orjson.dumps({"type": "error", "error": error_msg}) + SSE_SUFFIX
+        finally:
+            # New messages (and possibly a generated title) change this user's cached views
+            clear_sessions_cache(authenticated_user_id)
+    
+    return StreamingResponse(
+        generate_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache, no-store, must-revalidate",
+            "Pragma": "no-cache",
+            "Expires": "0",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",  # Disable nginx buffering
+        }
+    )
 
 @router.get("/sessions/{session_id}/info")
-def get_session_info_endpoint(session_id: str, current_user: dict = Depends(get_current_user)):
+async def get_session_info_endpoint(
+    session_id: str,
+    request: Request,
+    user_id: str = Depends(get_current_user_id)
+):
     """Get basic session information including updated title"""
+    # Polled by the UI to pick up the generated title; served from the sessions
+    # cache, which is cleared whenever this user's sessions or messages change
+    cache_key = (user_id, "info", session_id)
+    cached_data = get_cached_sessions(cache_key)
+    if cached_data:
+        etag = generate_etag(cached_data)
+        if not_modified(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return ORJSONResponse(cached_data, headers={"ETag": etag})
+    
+    # Get session info; the query is scoped to the caller, so a foreign session is simply not found
+    generation = sessions_cache_generation(user_id)
     try:
-        # Get the authenticated user's ID
-        supabase = get_supabase()
-        response = supabase.table("users").select("id").eq("email", current_user["email"]).execute()
-        if not response.data:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found"
-            )
-        
-        user_id = response.data[0]["id"]
-        
-        # Get session info (function handles ownership verification)
-        session_info = get_session_info(session_id)
-        
-        # Verify ownership
-        if session_info["user_id"] != user_id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You can only view your own chat sessions"
-            )
-        
-        return {
-            "session_id": session_info["id"],
-            "title": session_info["title"],
-            "created_at": session_info["created_at"],
-            "user_id": session_info["user_id"]
-        }
-        
+        session_info = await get_session_info(session_id, user_id)
     except ValueError as e:
         if "not found" in str(e).lower():
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Chat session not found"
-            )
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=str(e)
-            )
-    except Exception as e:
+            raise HTTPException(**SESSION_NOT_FOUND)
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to retrieve session info"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
+    
+    result = {
+        "session_id": session_info["id"],
+        "title": session_info["title"],
+        "created_at": session_info["created_at"],
+        "user_id": session_info["user_id"]
+    }
+    cache_sessions(cache_key, result, generation=generation)
+    
+    etag = generate_etag(result)
+    if not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return ORJSONResponse(result, headers={"ETag": etag})
 
-@router.get("/sessions/{session_id}/detail", response_model=ChatDetailResponse)
+# The detail payload is assembled from trusted DB rows, so it is returned as-is
+# instead of re-validating every message; ChatDetailResponse documents the shape
+@router.get("/sessions/{session_id}/detail", responses={200: {"model": ChatDetailResponse}})
 async def get_chat_detail_endpoint(
     session_id: str, 
     request: Request,
-    response: Response,
-    current_user: dict = Depends(get_current_user)
+    user_id: str = Depends(get_current_user_id)
 ):
     """
     Optimized endpoint to get detailed chat information with enhanced performance:
@@ -1198,76 +695,82 @@ async def get_chat_detail_endpoint(
     """
     start_time = time.time()
     
-    try:
-        # Use user ID directly from JWT token (no need for additional DB query)
-        user_id = current_user["id"]
-        
-        # Validate session_id format
-        if not session_id or not session_id.strip():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Session ID is required"
-            )
-        
-        session_id = session_id.strip()
-        
-        # Generate cache key
-        cache_key = f"chat_detail:{user_id}:{session_id}"
-        
-        # Check cache first
-        cached_data = get_cached_sessions(cache_key)
-        if cached_data:
-            # Set cache headers
-            response.headers["X-Cache"] = "HIT"
-            response.headers["Cache-Control"] = "private, max-age=30"
-            
-            processing_time = (time.time() - start_time) * 1000
-            print(f"Chat detail served from cache in {processing_time:.2f}ms for user {user_id}")
-            
-            return ChatDetailResponse(**cached_data)
-        
-        # Get chat detail using optimized function
-        chat_detail = await get_chat_detail_optimized(session_id, user_id)
-        
-        # Cache the result
-        cache_sessions(cache_key, chat_detail)
-        
-        # Set response headers
-        response.headers["X-Cache"] = "MISS"
-        response.headers["Cache-Control"] = "private, max-age=30"
+    # Validate session_id format
+    if not _ID_RE.fullmatch(session_id):
+        raise HTTPException(**INVALID_SESSION_ID)
+    
+    # Generate cache key (owned by the user so writes invalidate it)
+    cache_key = (user_id, "detail", session_id)
+    
+    # Check cache first; entries hold the encoded body and its ETag
+    cache_entry = get_cached_sessions_entry(cache_key)
+    if cache_entry:
+        headers = {"X-Cache": "HIT", "Cache-Control": "private, max-age=30", "ETag": cache_entry['etag']}
         
-        # Log performance
         processing_time = (time.time() - start_time) * 1000
-        print(f"Chat detail generated in {processing_time:.2f}ms for user {user_id}")
-        
-        return ChatDetailResponse(**chat_detail)
+        logger.debug("Chat detail served from cache in %.2fms for user %s", processing_time, user_id)
         
-    except HTTPException:
-        # Re-raise HTTP exceptions as-is
-        raise
+        # Unchanged since the client's last poll: headers only, no body
+        if not_modified(request, cache_entry['etag']):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=cache_entry['data'], media_type="application/json", headers=headers)
+    
+    # Get chat detail using optimized function; the query filters on user_id,
+    # so a missing or foreign session both surface as "not found"
+    generation = sessions_cache_generation(user_id)
+    try:
+        chat_detail = await get_chat_detail_optimized(session_id, user_id, message_limit=_detail_page_size)
     except ValueError as e:
-        # Handle specific validation errors
-        error_msg = str(e).lower()
-        if "not found" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Chat session not found"
-            )
-        elif "only view your own" in error_msg or "permission" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You can only view your own chat sessions"
-            )
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=str(e)
-            )
-    except Exception as e:
-        print(f"Error getting chat detail: {str(e)}")
+        if "not found" in str(e).lower():
+            raise HTTPException(**SESSION_NOT_FOUND)
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to retrieve chat detail"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
+    
+    # A full first page means there may be more: stream the history instead of
+    # materializing it (large histories are not cached)
+    if len(chat_detail["messages"]) >= _detail_page_size:
+        logger.info("Chat detail streaming for user %s (more than %d messages)", user_id, _detail_page_size)
+        return StreamingResponse(
+            stream_chat_detail(chat_detail),
+            media_type="application/json",
+            headers={"X-Cache": "MISS", "Cache-Control": "private, max-age=30"}
+        )
+    
+    # Serialize once; the same bytes (and their ETag) are cached and sent
+    body = orjson.dumps(chat_detail)
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    cache_sessions(cache_key, body, etag, generation=generation)
+    
+    headers = {"X-Cache": "MISS", "Cache-Control": "private, max-age=30", "ETag": etag}
+    
+    # Log performance
+    processing_time = (time.time() - start_time) * 1000
+    if random.random() < settings.log_sample_rate:
+        logger.info("Chat detail generated in %.2fms for user %s", processing_time, user_id)
+    
+    if not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
-
+async def stream_chat_detail(chat_detail: dict):
+    """
+    Emit a chat detail JSON document page by page, starting from the
+    already-loaded first page of messages
+    """
+    session_fields = {k: v for k, v in chat_detail.items() if k not in ("messages", "total_messages")}
+    # Reopen the serialized session object to append the messages array
+    yield orjson.dumps(session_fields)[:-1] + b',"messages":['
+    
+    messages = chat_detail["messages"]
+    total_messages = 0
+    while messages:
+        # Strip the surrounding brackets so pages join into one array
+        yield (b"," if total_messages else b"") + orjson.dumps(messages)[1:-1]
+        total_messages += len(messages)
+        if len(messages) < _detail_page_size:
+            break
+        messages = await get_chat_messages_page(chat_detail["session_id"], total_messages, _detail_page_size)
+    
+    yield b'],"total_messages":' + str(total_messages).encode() + b"}"
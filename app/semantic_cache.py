@@ -0,0 +1,158 @@
+"""
+In-memory cache of assistant answers to the opening message of a chat.
+
+Entries are namespaced by (user_id, day): answers depend on the user's store
+data and resolve relative dates against today, so nothing is reused across
+users or days. Lookups try an exact match on the canonical message first,
+then the closest stored embedding by cosine similarity. Embeddings are stored
+at unit length, so similarity is a single dot product per entry.
+"""
+import re
+import math
+import time
+import hashlib
+from operator import mul
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Tuple
+from .config import settings
+
+# (user_id, ISO day) -> {"exact": {message hash: entry}, "vectors": [(unit vector, entry)]}
+_namespaces: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+_max_namespaces = 1_000
+_max_entries_per_namespace = 100
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# A paragraph plus the blank line(s) after it
+_PARAGRAPH_RE = re.compile(r".+?(?:\n\s*\n|$)", re.S)
+# Conversational filler that does not change what is being asked
+_FILLER_RE = re.compile(r"\b(please|can you|could you|would you|thanks|thank you|for me)\b", re.I)
+# Messages that paste context before the actual ask end with a "Question:" section
+_QUESTION_MARKER_RE = re.compile(r"\bquestion\s*:", re.I)
+
+def canonicalize(message: str) -> str:
+    """
+    Reduce a prompt to a canonical form: the whole message without filler
+    words or trailing punctuation, lowercased with collapsed whitespace. Any
+    pasted context stays in, so prompts about different data never share an
+    answer. Used for both the exact key and the embedding input.
+    """
+    message = _FILLER_RE.sub(" ", message)
+    return _WHITESPACE_RE.sub(" ", message).strip(" ?!.,").lower()
+
+def _message_key(message: str) -> bytes:
+    return hashlib.sha256(canonicalize(message).encode()).digest()
+
+def _context_key(message: str) -> bytes:
+    """
+    Hash of the context pasted before a "Question:" marker (empty if none).
+    Similar questions only match when their context is identical, since an
+    embedding barely moves when just the pasted data differs.
+    """
+    parts = _QUESTION_MARKER_RE.split(message)
+    context = " ".join(parts[:-1]) if len(parts) > 1 else ""
+    return hashlib.sha256(canonicalize(context).encode()).digest()
+
+def _get_namespace(user_id: str, create: bool = False) -> Optional[Dict]:
+    today = date.today().isoformat()
+    key = (user_id, today)
+    namespace = _namespaces.get(key)
+    if namespace is not None:
+        _namespaces.move_to_end(key)
+    elif create:
+        # Answers from previous days are never served again
+        for stale_key in [k for k in _namespaces if k[1] != today]:
+            del _namespaces[stale_key]
+        namespace = _namespaces[key] = {"exact": {}, "vectors": []}
+        while len(_namespaces) > _max_namespaces:
+            _namespaces.popitem(last=False)
+    return namespace
+
+def _unit_vector(embedding: List[float]) -> Optional[Tuple[float, ...]]:
+    norm = math.sqrt(sum(map(mul, embedding, embedding)))
+    if not norm:
+        return None
+    return tuple(x / norm for x in embedding)
+
+def _is_fresh(entry: Dict) -> bool:
+    return time.time() - entry['timestamp'] < settings.semantic_cache_ttl
+
+def get_exact(user_id: str, message: str) -> Optional[str]:
+    """Return the cached answer for this exact (canonical) message, if any"""
+    namespace = _get_namespace(user_id)
+    if namespace is None:
+        return None
+    entry = namespace["exact"].get(_message_key(message))
+    if entry is None or not _is_fresh(entry):
+        return None
+    return entry['data']
+
+def has_vectors(user_id: str) -> bool:
+    """
+    Whether a similarity lookup could possibly hit: False means this user has
+    no fresh embeddings today, so embedding the prompt would be wasted work
+    """
+    namespace = _get_namespace(user_id)
+    if namespace is None:
+        return False
+    return any(_is_fresh(entry) for _, entry in namespace["vectors"])
+
+def get_similar(user_id: str, message: str, embedding: List[float]) -> Optional[str]:
+    """
+    Return the cached answer whose prompt embedding is closest, if similar
+    enough, among prompts with the same pasted context as this message
+    """
+    namespace = _get_namespace(user_id)
+    if namespace is None or not namespace["vectors"]:
+        return None
+
+    query = _unit_vector(embedding)
+    if query is None:
+        return None
+
+    context = _context_key(message)
+    best_entry, best_score = None, -1.0
+    for vector, entry in namespace["vectors"]:
+        if entry['context'] != context or not _is_fresh(entry):
+            continue
+        score = sum(map(mul, query, vector))
+        if score > best_score:
+            best_entry, best_score = entry, score
+
+    if best_entry is None or best_score < settings.semantic_cache_threshold:
+        return None
+    return best_entry['data']
+
+def store(user_id: str, message: str, embedding: Optional[List[float]], response: str):
+    """Cache an answer under its message, and under its embedding when one is available"""
+    namespace = _get_namespace(user_id, create=True)
+    entry = {'data': response, 'message': message, 'context': _context_key(message), 'timestamp': time.time()}
+
+    exact = namespace["exact"]
+    exact[_message_key(message)] = entry
+    if len(exact) > _max_entries_per_namespace:
+        del exact[next(iter(exact))]
+
+    vector = _unit_vector(embedding) if embedding else None
+    if vector is not None:
+        vectors = namespace["vectors"]
+        vectors.append((vector, entry))
+        if len(vectors) > _max_entries_per_namespace:
+            vectors.pop(0)
+
+def replay_chunks(response: str, max_chunks: int = 3) -> Iterator[str]:
+    """
+    Split a cached answer into at most max_chunks frames on paragraph
+    boundaries, keeping its exact whitespace. The answer is already complete,
+    so it is sent in a few large frames rather than at token pacing.
+    """
+    paragraphs = _PARAGRAPH_RE.findall(response)
+    target = len(response) / max_chunks
+    chunk = ""
+    for paragraph in paragraphs:
+        chunk += paragraph
+        if len(chunk) >= target:
+            yield chunk
+            chunk = ""
+    if chunk:
+        yield chunk
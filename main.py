@@ -1,24 +1,151 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder
 from app.routes import auth, chat
+from app.chat import warm_up_openai
+from app.database import warm_up_supabase, close_supabase
+from app.config import settings
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import logging
+import queue
+
+def configure_logging():
+    """
+    Send app log records through a queue; a listener thread does the actual
+    stream I/O so logging never blocks the event loop
+    """
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    listener = QueueListener(log_queue, stream_handler)
+    
+    app_logger = logging.getLogger("app")
+    app_logger.setLevel(settings.log_level.upper())
+    app_logger.addHandler(QueueHandler(log_queue))
+    app_logger.propagate = False
+    
+    listener.start()
+    atexit.register(listener.stop)
+
+configure_logging()
+logger = logging.getLogger("app")
 
 app = FastAPI(
     title="Pacer CIL Chatbot",
     description="A FastAPI application with OpenAI GPT-4 integration and Supabase Edge Functions",
     version="1.0.0",
     docs_url=None, 
-    redoc_url=None
+    redoc_url=None,
+    # orjson serializes large payloads (chat detail, session listings) several times faster
+    default_response_class=ORJSONResponse
 )
 
-# CORS middleware
+# Server-sent event streams must reach the client chunk by chunk; gzip would
+# buffer them inside the compressor, so these paths are sent uncompressed
+_UNCOMPRESSED_PATHS = {"/api/chat/chat"}
+
+class BufferedOnlyGZipResponder(GZipResponder):
+    """
+    Compress responses whose body arrives in one message; streamed bodies
+    (StreamingResponse) pass through uncompressed so each chunk goes out as
+    soon as it is produced instead of waiting in the compressor
+    """
+    async def send_with_gzip(self, message):
+        if message["type"] == "http.response.body" and not self.started and message.get("more_body", False):
+            # Same path GZipResponder takes for an already-encoded response
+            self.content_encoding_set = True
+        await super().send_with_gzip(message)
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] == "http"
+            and scope["path"] not in _UNCOMPRESSED_PATHS
+            and "gzip" in Headers(scope=scope).get("Accept-Encoding", "")
+        ):
+            responder = BufferedOnlyGZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+            await responder(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+class SessionsCacheFastPathMiddleware:
+    """
+    Serve cached GET /api/chat/sessions pages before routing and dependency
+    injection; anything the cache cannot answer falls through to the app
+    """
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "GET" and scope["path"] == "/api/chat/sessions":
+            response = chat.sessions_fast_path_response(scope)
+            if response is not None:
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+# Innermost, so fast-path responses still get compression and CORS headers
+app.add_middleware(SessionsCacheFastPathMiddleware)
+
+# Response compression for JSON payloads (session listings, chat detail)
+app.add_middleware(SelectiveGZipMiddleware, minimum_size=500, compresslevel=5)
+
+# CORS middleware; browsers refuse credentialed responses for a wildcard
+# origin, so credentials are only allowed with an explicit origin list
+cors_origins = [origin.strip() for origin in settings.cors_allowed_origins.split(",") if origin.strip()]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
+    allow_origins=cors_origins,
+    allow_credentials="*" not in cors_origins,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets browser clients read cache status and revalidate with If-None-Match
+    expose_headers=["X-Cache", "ETag"],
 )
 
+def cors_error_headers(request: Request) -> dict:
+    """
+    CORS headers for responses built by the Exception handler: Starlette runs
+    it outside CORSMiddleware, so without these browsers would hide the JSON
+    error behind an opaque CORS failure. Mirrors the middleware's settings.
+    """
+    origin = request.headers.get("origin")
+    if not origin:
+        return {}
+    if "*" in cors_origins:
+        return {"Access-Control-Allow-Origin": "*"}
+    if origin in cors_origins:
+        return {"Access-Control-Allow-Origin": origin, "Access-Control-Allow-Credentials": "true", "Vary": "Origin"}
+    return {}
+
+@app.exception_handler(Exception)
+async def unhandled_exception_handler(request: Request, exc: Exception):
+    """
+    Single place that turns unexpected errors into a generic 500, so route
+    handlers no longer need their own catch-all try/except blocks
+    """
+    logger.exception("Unhandled error on %s %s", request.method, request.url.path, exc_info=exc)
+    return ORJSONResponse(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        content={"detail": "Internal server error"},
+        headers=cors_error_headers(request)
+    )
+
+@app.on_event("startup")
+async def warm_up():
+    """Open outbound connections before the first request needs them"""
+    await warm_up_supabase()
+    if settings.semantic_cache_enabled:
+        await warm_up_openai()
+
+@app.on_event("shutdown")
+def close_clients():
+    close_supabase()
+
 # Include routers
 app.include_router(auth.router, prefix="/api")
 app.include_router(chat.router, prefix="/api")
@@ -33,4 +160,7 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # uvloop and httptools ship with uvicorn[standard]; named explicitly so a
+    # missing extra fails loudly instead of falling back to asyncio/h11.
+    # Single process: caches and rate limits are per-process memory.
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools")
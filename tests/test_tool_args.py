@@ -0,0 +1,37 @@
+import unittest
+from datetime import date, datetime, timedelta, timezone
+
+from app.chat import normalize_date_args
+from app.models import CampaignReasoningArgs
+
+
+class CampaignReasoningRangeTest(unittest.TestCase):
+    def test_bare_end_date_takes_timezone_of_start(self):
+        args = normalize_date_args("getCampaignReasoning", {
+            "start_date": "2024-07-01T00:00:00Z",
+            "end_date": "2024-07-31",
+        })
+        self.assertEqual(args["end_date"], "2024-08-01T00:00:00+00:00")
+
+        parsed = CampaignReasoningArgs(**args)
+        self.assertEqual(parsed.end_date, datetime(2024, 8, 1, tzinfo=timezone.utc))
+
+    def test_relative_start_takes_timezone_of_end(self):
+        tomorrow = date.today() + timedelta(days=1)
+        args = normalize_date_args("getCampaignReasoning", {
+            "start_date": "today",
+            "end_date": f"{tomorrow.isoformat()}T12:00:00+02:00",
+        })
+        self.assertTrue(args["start_date"].endswith("+02:00"))
+        CampaignReasoningArgs(**args)
+
+    def test_mixed_awareness_compares_without_type_error(self):
+        parsed = CampaignReasoningArgs(start_date="2024-07-01T00:00:00Z", end_date="2024-07-31T00:00:00")
+        self.assertIsNone(parsed.end_date.tzinfo)
+
+        with self.assertRaises(ValueError):
+            CampaignReasoningArgs(start_date="2024-07-31T00:00:00Z", end_date="2024-07-01T00:00:00")
+
+
+if __name__ == "__main__":
+    unittest.main()